@@ -0,0 +1,179 @@
+import os
+import uuid
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from time import monotonic
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+@dataclass
+class Admission:
+    admitted: bool
+    ticket: Optional[str] = None
+    position: int = 0
+    retry_after: int = 0
+    reason: str = ""
+
+
+def read_headroom() -> Tuple[float, float]:
+    """(1-minute load per CPU, fraction of memory available) for this host."""
+    try:
+        with open("/proc/loadavg") as f:
+            load = float(f.read().split()[0])
+    except OSError:
+        load = os.getloadavg()[0]
+    available = 1.0
+    try:
+        with open("/proc/meminfo") as f:
+            info = dict(line.split(":", 1) for line in f)
+        total = int(info["MemTotal"].split()[0])
+        available = int(info["MemAvailable"].split()[0]) / total
+    except (OSError, KeyError, ValueError):
+        pass
+    return load / (os.cpu_count() or 1), available
+
+
+@dataclass
+class _Waiting:
+    seq: int
+    seen: float
+
+
+class SessionScheduler:
+    """Admits bot sessions against live-session, CPU and memory limits.
+
+    Callers that can't start now take a ticket in a FIFO queue and retry
+    with it; once the queue holds `max_queue` tickets further calls are shed.
+    Every decision is O(1): the live count is a counter, queue positions come
+    from sequence numbers, abandoned tickets are dropped when they reach the
+    head, and host headroom is sampled at most every `sample_interval`.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 8,
+        max_queue: int = 16,
+        max_load: float = 0.85,
+        min_free_memory: float = 0.1,
+        ticket_ttl: float = 15.0,
+        poll_after: int = 2,
+        shed_retry_after: int = 30,
+        sample_interval: float = 1.0,
+        headroom: Callable[[], Tuple[float, float]] = read_headroom,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        self.max_sessions = max_sessions
+        self.max_queue = max_queue
+        self.max_load = max_load
+        self.min_free_memory = min_free_memory
+        self.ticket_ttl = ticket_ttl
+        self.poll_after = poll_after
+        self.shed_retry_after = shed_retry_after
+        self.sample_interval = sample_interval
+        self.headroom = headroom
+        self.clock = clock
+        self.live = 0
+        self.admitted = 0
+        self.shed = 0
+        self.rooms: Counter = Counter()
+        self._waiting: "OrderedDict[str, _Waiting]" = OrderedDict()
+        self._next_seq = 0
+        self._head_seq = 0
+        self._sample: Tuple[float, float] = (0.0, 1.0)
+        self._sampled_at = float("-inf")
+
+    def request(self, ticket: Optional[str] = None) -> Admission:
+        """Admit now, keep (or give) a place in the queue, or shed the call."""
+        now = self.clock()
+        waiting = self._waiting.get(ticket) if ticket else None
+        if waiting:
+            waiting.seen = now
+        self._drop_abandoned(now)
+
+        reason = self._saturated(now)
+        if not reason:
+            if not self._waiting:
+                return self._admit()
+            head = next(iter(self._waiting))
+            if head == ticket:
+                self._waiting.popitem(last=False)
+                self._head_seq = waiting.seq + 1
+                return self._admit()
+
+        if waiting:
+            return self._queued(ticket, waiting, reason)
+        if len(self._waiting) < self.max_queue:
+            ticket = uuid.uuid4().hex
+            waiting = _Waiting(seq=self._next_seq, seen=now)
+            self._next_seq += 1
+            self._waiting[ticket] = waiting
+            return self._queued(ticket, waiting, reason or "queue")
+
+        self.shed += 1
+        return Admission(
+            admitted=False,
+            retry_after=self.shed_retry_after,
+            reason=reason or "queue full",
+        )
+
+    def attach(self, room_url: str) -> None:
+        """Record which room an admitted session went to."""
+        self.rooms[room_url] += 1
+
+    def release(self, room_url: Optional[str] = None) -> None:
+        """A session ended (or never started): free its slot."""
+        self.live = max(self.live - 1, 0)
+        if room_url and self.rooms[room_url]:
+            self.rooms[room_url] -= 1
+            if not self.rooms[room_url]:
+                del self.rooms[room_url]
+
+    def in_room(self, room_url: str) -> int:
+        return self.rooms.get(room_url, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        load, memory = self._sample
+        return {
+            "live": self.live,
+            "queued": len(self._waiting),
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "load_per_cpu": round(load, 2),
+            "memory_available": round(memory, 3),
+        }
+
+    def _admit(self) -> Admission:
+        self.live += 1
+        self.admitted += 1
+        return Admission(admitted=True)
+
+    def _queued(self, ticket: str, waiting: _Waiting, reason: str) -> Admission:
+        return Admission(
+            admitted=False,
+            ticket=ticket,
+            position=waiting.seq - self._head_seq + 1,
+            retry_after=self.poll_after,
+            reason=reason,
+        )
+
+    def _drop_abandoned(self, now: float) -> None:
+        # Only the head is checked, so each ticket is dropped at most once.
+        while self._waiting:
+            ticket, waiting = next(iter(self._waiting.items()))
+            if now - waiting.seen <= self.ticket_ttl:
+                break
+            self._waiting.popitem(last=False)
+            self._head_seq = waiting.seq + 1
+
+    def _saturated(self, now: float) -> str:
+        if self.live >= self.max_sessions:
+            return "sessions"
+        if now - self._sampled_at >= self.sample_interval:
+            self._sample = self.headroom()
+            self._sampled_at = now
+        load, memory = self._sample
+        if load >= self.max_load:
+            return "cpu"
+        if memory <= self.min_free_memory:
+            return "memory"
+        return ""
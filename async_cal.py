@@ -0,0 +1,86 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Any, Callable, List, Optional
+
+from loguru import logger
+
+from holds import SlotHolds
+
+from cal import (
+    CalendarBackend,
+    PendingEvent,
+    book_visit,
+    cached_free_times,
+    create_event,
+    next_free_slot,
+)
+
+
+class AsyncCalendar:
+    """Awaitable front for cal.py.
+
+    Backends are synchronous (gcsa, sqlite3), so every call runs on a small
+    dedicated thread pool and the pipeline's event loop keeps moving audio
+    while the backend answers.
+    Each call is bounded by a timeout. If the awaiting task is cancelled (the
+    caller interrupted the bot) the pending call is dropped; one that already
+    started finishes in its thread and its result is discarded.
+    """
+
+    def __init__(
+        self,
+        cal: CalendarBackend,
+        max_workers: int = 4,
+        timeout: float = 10.0,
+        holds: Optional[SlotHolds] = None,
+    ) -> None:
+        self.cal = cal
+        self.holds = holds
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="calendar"
+        )
+
+    async def _run(
+        self, func: Callable[..., Any], *args: Any, timeout: Optional[float] = None
+    ) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, functools.partial(func, *args))
+        try:
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Calendar call {func.__name__} timed out")
+            raise
+        except asyncio.CancelledError:
+            logger.debug(f"Calendar call {func.__name__} cancelled")
+            raise
+
+    async def free_times(self, department: Optional[str] = None) -> List[str]:
+        return await self._run(cached_free_times, self.cal, department)
+
+    async def next_free_slot(
+        self, day: date, department: Optional[str] = None
+    ) -> Optional[datetime]:
+        return await self._run(next_free_slot, self.cal, day, department)
+
+    async def book_visit(
+        self, day: date, summary: str, session: str, department: Optional[str] = None
+    ) -> Optional[datetime]:
+        return await self._run(
+            book_visit, self.cal, day, summary, self.holds, session, department
+        )
+
+    async def release_holds(self, session: str) -> None:
+        if self.holds is not None:
+            await self._run(self.holds.release, session)
+
+    async def create_event(self, start: datetime, summary: str) -> None:
+        await self._run(create_event, self.cal, start, summary)
+
+    async def add_events(self, events: List[PendingEvent]) -> None:
+        await self._run(self.cal.add_events, events)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,68 @@
+"""Micro-benchmark: legacy free_times filtering vs AvailabilityIndex.
+
+python bench_availability.py [--events 5000] [--days 90]
+"""
+
+import argparse
+import random
+from datetime import datetime, timedelta
+from timeit import timeit
+
+from gcsa.event import Event
+
+from cal import AvailabilityIndex
+
+
+def legacy_free_times(events, today, horizon_end):
+    # The list-in-list filtering free_times used before the index.
+    available_dates = [
+        today + timedelta(days=i) for i in range((horizon_end - today).days + 1)
+    ]
+    event_dates = [event.start.strftime("%Y-%m-%d") for event in events]
+    available_dates = [date.strftime("%Y-%m-%d") for date in available_dates]
+    return [
+        date
+        for date in available_dates
+        if date not in [str(event) for event in event_dates]
+    ]
+
+
+def make_events(count: int, today: datetime, days: int):
+    rng = random.Random(0)
+    events = []
+    for _ in range(count):
+        start = today.replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(
+            days=rng.randrange(days), minutes=15 * rng.randrange(36)
+        )
+        events.append(Event("visit", start=start, end=start + timedelta(minutes=30)))
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    today = datetime.now()
+    horizon_end = today + timedelta(days=args.days)
+    events = make_events(args.events, today, args.days)
+
+    legacy = timeit(
+        lambda: legacy_free_times(events, today, horizon_end), number=args.repeat
+    )
+    build = timeit(lambda: AvailabilityIndex.from_events(events), number=args.repeat)
+    index = AvailabilityIndex.from_events(events)
+    query = timeit(lambda: index.free_dates(today, horizon_end), number=args.repeat)
+    slot = timeit(lambda: index.first_free_slot(today, horizon_end), number=args.repeat)
+
+    print(f"{args.events} events over {args.days} days, {args.repeat} runs")
+    print(f"legacy free_times      {legacy / args.repeat * 1e3:10.3f} ms")
+    print(f"index build            {build / args.repeat * 1e3:10.3f} ms")
+    print(f"index free_dates       {query / args.repeat * 1e3:10.3f} ms")
+    print(f"index first_free_slot  {slot / args.repeat * 1e6:10.3f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Compare calendar backend latencies with simulated bookings.
+
+    python bench_backends.py [--bookings 5000] [--google]
+
+--google also measures the live Google Calendar (EMAIL_ID), with far fewer
+bookings; leave it off to stay offline.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, time, timedelta
+from statistics import quantiles
+from time import perf_counter
+
+from dotenv import load_dotenv
+from loguru import logger
+
+from cal import (
+    GoogleCalendarBackend,
+    SQLiteCalendarBackend,
+    build_index,
+    create_event,
+)
+from outbox import BookingOutbox, OutboxBackend
+
+
+def run(name: str, backend, bookings: int) -> None:
+    rng = random.Random(0)
+    today = datetime.combine(datetime.now().date(), time(9))
+    latencies = []
+    started = perf_counter()
+    for i in range(bookings):
+        start = today + timedelta(
+            days=rng.randrange(14), minutes=15 * rng.randrange(36)
+        )
+        t = perf_counter()
+        create_event(backend, start, f"simulated visit {i}")
+        latencies.append(perf_counter() - t)
+    elapsed = perf_counter() - started
+
+    t = perf_counter()
+    index = build_index(backend)
+    fetch = perf_counter() - t
+
+    cuts = quantiles(latencies, n=100)
+    print(
+        f"{name:<14} {bookings / elapsed:10.0f} bookings/s"
+        f"  p50 {cuts[49] * 1e6:8.1f} us  p99 {cuts[98] * 1e6:8.1f} us"
+        f"  fetch+index {fetch * 1e3:7.2f} ms ({len(index)} busy intervals)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bookings", type=int, default=5000)
+    parser.add_argument("--google", action="store_true")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="INFO")
+
+    run("sqlite memory", SQLiteCalendarBackend(), args.bookings)
+    with tempfile.TemporaryDirectory() as tmp:
+        run(
+            "sqlite file",
+            SQLiteCalendarBackend(os.path.join(tmp, "cal.db")),
+            args.bookings,
+        )
+        run(
+            "outbox",
+            OutboxBackend(
+                SQLiteCalendarBackend(), BookingOutbox(os.path.join(tmp, "o.db"))
+            ),
+            args.bookings,
+        )
+    if args.google:
+        load_dotenv()
+        run("google", GoogleCalendarBackend(os.getenv("EMAIL_ID", "")), 20)
+
+
+if __name__ == "__main__":
+    main()
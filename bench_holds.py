@@ -0,0 +1,94 @@
+"""Contention benchmark for slot holds across worker processes.
+
+    python bench_holds.py [--processes 8] [--sessions 32]
+
+Every session (processes x sessions in total) asks for the first free slot
+of the same list, like callers racing for the earliest appointment of the
+day. Reports hold throughput and latency (including time queued behind the
+other sessions) and checks that no slot went to two sessions.
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from statistics import quantiles
+from time import perf_counter
+
+from holds import SlotHolds
+
+DAY = datetime(2030, 1, 7, 8)
+
+
+def worker(path: str, index: int, sessions: int, slots: int, results) -> None:
+    holds = SlotHolds(path)
+    candidates = [
+        (DAY + timedelta(minutes=30 * i), DAY + timedelta(minutes=30 * (i + 1)))
+        for i in range(slots)
+    ]
+    won, latencies = [], []
+    lock = threading.Lock()
+
+    def session(name: str) -> None:
+        t = perf_counter()
+        held = holds.hold_first(candidates, name)
+        if held is not None:
+            holds.confirm(*held, name)
+        elapsed = perf_counter() - t
+        with lock:
+            won.append(held and held[0])
+            latencies.append(elapsed)
+
+    threads = [
+        threading.Thread(target=session, args=(f"p{index}-s{i}",))
+        for i in range(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((won, latencies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--sessions", type=int, default=32)
+    args = parser.parse_args()
+    total = args.processes * args.sessions
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "holds.db")
+        SlotHolds(path).close()
+        results = multiprocessing.Queue()
+        started = perf_counter()
+        procs = [
+            multiprocessing.Process(
+                target=worker, args=(path, i, args.sessions, total, results)
+            )
+            for i in range(args.processes)
+        ]
+        for proc in procs:
+            proc.start()
+        won, latencies = [], []
+        for _ in procs:
+            w, l = results.get()
+            won += w
+            latencies += l
+        for proc in procs:
+            proc.join()
+        elapsed = perf_counter() - started
+
+    booked = [start for start in won if start is not None]
+    cuts = quantiles(latencies, n=100)
+    print(f"{total} sessions in {args.processes} processes, {elapsed:.2f}s")
+    print(f"{total / elapsed:.0f} holds/s")
+    print(f"booked {len(booked)}, distinct {len(set(booked))}")
+    print(f"time to hold p50 {cuts[49] * 1e3:.2f} ms  p99 {cuts[98] * 1e3:.2f} ms")
+    assert len(booked) == len(set(booked)), "double booking"
+
+
+if __name__ == "__main__":
+    main()
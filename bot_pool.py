@@ -0,0 +1,354 @@
+import asyncio
+import importlib
+import inspect
+import multiprocessing
+import os
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection
+from statistics import quantiles
+from time import monotonic
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+
+import aiohttp
+from loguru import logger
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+def _resolve(path: str) -> Callable:
+    module, name = path.split(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def _worker_main(
+    conn: Connection, bot: str, warmup: Optional[str], max_calls: int
+) -> None:
+    asyncio.run(_worker_loop(conn, bot, warmup, max_calls))
+
+
+async def _worker_loop(
+    conn: Connection, bot: str, warmup: Optional[str], max_calls: int
+) -> None:
+    """Child side: warm up once, then run assigned calls until recycled."""
+    run_bot = _resolve(bot)
+    if warmup:
+        result = _resolve(warmup)()
+        if inspect.isawaitable(result):
+            await result
+
+    loop = asyncio.get_running_loop()
+    inbox: asyncio.Queue = asyncio.Queue()
+
+    def receive():
+        try:
+            inbox.put_nowait(conn.recv())
+        except EOFError:
+            loop.remove_reader(conn.fileno())
+            inbox.put_nowait(("stop",))
+
+    loop.add_reader(conn.fileno(), receive)
+    conn.send(("ready", os.getpid()))
+
+    calls = 0
+    running: Dict[str, asyncio.Task] = {}
+
+    async def run_call(session_id: str, room_url: str, token: Optional[str]):
+        async def on_joined():
+            conn.send(("joined", session_id))
+
+        error = None
+        try:
+            await run_bot(
+                room_url, token, http, on_joined=on_joined, handle_sigint=False
+            )
+        except Exception as e:
+            logger.exception(f"Call {session_id} failed: {e}")
+            error = str(e)
+        inbox.put_nowait(("done", session_id, error))
+
+    async with aiohttp.ClientSession() as http:
+        while True:
+            message = await inbox.get()
+            kind = message[0]
+            if kind == "assign":
+                _, session_id, room_url, token = message
+                calls += 1
+                running[session_id] = asyncio.create_task(
+                    run_call(session_id, room_url, token)
+                )
+            elif kind == "done":
+                _, session_id, error = message
+                running.pop(session_id, None)
+                conn.send(("finished", session_id, error))
+                if calls >= max_calls and not running:
+                    break
+            elif kind == "ping":
+                conn.send(("pong", message[1], len(running)))
+            elif kind == "stop":
+                for task in running.values():
+                    task.cancel()
+                await asyncio.gather(*running.values(), return_exceptions=True)
+                break
+    loop.remove_reader(conn.fileno())
+    conn.close()
+
+
+@dataclass
+class PooledSession:
+    session_id: str
+    room_url: str
+    worker_pid: int
+    requested_at: float
+    assigned_at: float
+    joined_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def status(self) -> str:
+        if self.finished_at is not None:
+            return "finished"
+        return "running" if self.joined_at is not None else "starting"
+
+
+@dataclass
+class _Worker:
+    process: multiprocessing.process.BaseProcess
+    conn: Connection
+    started_at: float
+    pid: Optional[int] = None
+    ready: bool = False
+    draining: bool = False
+    calls: int = 0
+    sessions: Set[str] = field(default_factory=set)
+    last_pong: float = 0.0
+
+
+class BotWorkerPool:
+    """Pre-started bot processes that take (room_url, token) over a pipe.
+
+    Each worker imports the bot module and runs `warmup` before reporting
+    ready, so an assigned call only pays for joining the room. A worker takes
+    up to `sessions_per_worker` concurrent calls, is recycled after
+    `max_calls`, and is replaced if it dies or stops answering pings.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        bot: str = "patient_flow:run_bot",
+        warmup: Optional[str] = "patient_flow:warm_up",
+        max_calls: int = 20,
+        sessions_per_worker: int = 1,
+        health_interval: float = 5.0,
+        start_timeout: float = 60.0,
+        on_joined: Optional[Callable[[PooledSession], None]] = None,
+        on_finished: Optional[Callable[[PooledSession], None]] = None,
+        keep_finished: int = 1000,
+    ) -> None:
+        self.size = size
+        self.bot = bot
+        self.warmup = warmup
+        self.max_calls = max_calls
+        self.sessions_per_worker = sessions_per_worker
+        self.health_interval = health_interval
+        self.start_timeout = start_timeout
+        self.on_joined = on_joined
+        self.on_finished = on_finished
+        self.keep_finished = keep_finished
+        # Live sessions, and the most recent finished ones for status lookups.
+        self.sessions: Dict[str, PooledSession] = {}
+        self.finished: "OrderedDict[str, PooledSession]" = OrderedDict()
+        self.join_latencies: Deque[float] = deque(maxlen=1000)
+        self.restarts = 0
+        self._workers: List[_Worker] = []
+        self._ctx = multiprocessing.get_context("spawn")
+        self._health_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        for _ in range(self.size):
+            self._spawn()
+        self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+
+    async def stop(self) -> None:
+        if self._health_task:
+            self._health_task.cancel()
+        workers = list(self._workers)
+        for worker in workers:
+            self._retire(worker, graceful=True)
+        for worker in workers:
+            await asyncio.to_thread(worker.process.join, 5)
+            if worker.process.is_alive():
+                worker.process.kill()
+        self._workers.clear()
+
+    def assign(
+        self, room_url: str, token: Optional[str], requested_at: Optional[float] = None
+    ) -> PooledSession:
+        """Hand a call to the least busy warm worker. Raises PoolExhausted."""
+        candidates = [
+            worker
+            for worker in self._workers
+            if worker.ready
+            and not worker.draining
+            and len(worker.sessions) < self.sessions_per_worker
+        ]
+        if not candidates:
+            raise PoolExhausted("No warm bot worker available")
+        worker = min(candidates, key=lambda worker: len(worker.sessions))
+
+        now = monotonic()
+        session = PooledSession(
+            session_id=uuid.uuid4().hex,
+            room_url=room_url,
+            worker_pid=worker.pid,
+            requested_at=requested_at or now,
+            assigned_at=now,
+        )
+        worker.conn.send(("assign", session.session_id, room_url, token))
+        worker.calls += 1
+        worker.sessions.add(session.session_id)
+        self.sessions[session.session_id] = session
+        if worker.calls >= self.max_calls:
+            # Finishes its calls then exits; a fresh worker takes its place now.
+            worker.draining = True
+            self._spawn()
+        return session
+
+    def get(self, session_id: str) -> Optional[PooledSession]:
+        return self.sessions.get(session_id) or self.finished.get(session_id)
+
+    def idle_workers(self) -> int:
+        return sum(
+            1
+            for worker in self._workers
+            if worker.ready and not worker.draining and not worker.sessions
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {
+            "workers": len(self._workers),
+            "ready": sum(1 for worker in self._workers if worker.ready),
+            "idle": self.idle_workers(),
+            "active_sessions": sum(len(w.sessions) for w in self._workers),
+            "restarts": self.restarts,
+            "joins": len(self.join_latencies),
+        }
+        if len(self.join_latencies) >= 2:
+            cuts = quantiles(self.join_latencies, n=100)
+            stats["join_latency_p50_ms"] = round(cuts[49] * 1000, 1)
+            stats["join_latency_p95_ms"] = round(cuts[94] * 1000, 1)
+        return stats
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.bot, self.warmup, self.max_calls),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        worker = _Worker(process=process, conn=parent_conn, started_at=monotonic())
+        self._workers.append(worker)
+        asyncio.get_running_loop().add_reader(
+            parent_conn.fileno(), self._on_readable, worker
+        )
+        return worker
+
+    def _on_readable(self, worker: _Worker) -> None:
+        try:
+            message = worker.conn.recv()
+        except (EOFError, OSError):
+            self._on_exit(worker)
+            return
+        kind = message[0]
+        now = monotonic()
+        if kind == "ready":
+            worker.pid = message[1]
+            worker.ready = True
+            worker.last_pong = now
+            logger.debug(
+                f"Bot worker {worker.pid} warm in {now - worker.started_at:.2f}s"
+            )
+        elif kind == "joined":
+            session = self.sessions.get(message[1])
+            if session:
+                session.joined_at = now
+                self.join_latencies.append(now - session.requested_at)
+                if self.on_joined:
+                    self.on_joined(session)
+                logger.info(
+                    f"Bot joined {session.room_url} "
+                    f"{(now - session.requested_at) * 1000:.0f}ms after request"
+                )
+        elif kind == "finished":
+            _, session_id, error = message
+            worker.sessions.discard(session_id)
+            session = self.sessions.get(session_id)
+            if session:
+                self._finish(session, error)
+        elif kind == "pong":
+            worker.last_pong = now
+
+    def _on_exit(self, worker: _Worker) -> None:
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(worker.conn.fileno())
+        worker.conn.close()
+        if worker in self._workers:
+            self._workers.remove(worker)
+        for session_id in worker.sessions:
+            session = self.sessions.get(session_id)
+            if session:
+                self._finish(session, "worker exited")
+        if not worker.draining:
+            logger.warning(f"Bot worker {worker.pid} exited unexpectedly")
+            self.restarts += 1
+            self._spawn()
+
+    def _finish(self, session: PooledSession, error: Optional[str]) -> None:
+        session.finished_at = monotonic()
+        session.error = error
+        del self.sessions[session.session_id]
+        self.finished[session.session_id] = session
+        if len(self.finished) > self.keep_finished:
+            self.finished.popitem(last=False)
+        if self.on_finished:
+            self.on_finished(session)
+
+    def _retire(self, worker: _Worker, graceful: bool) -> None:
+        worker.draining = True
+        try:
+            if graceful:
+                worker.conn.send(("stop",))
+            else:
+                worker.process.kill()
+        except OSError:
+            pass
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval)
+            now = monotonic()
+            for worker in list(self._workers):
+                stuck = (
+                    not worker.ready and now - worker.started_at > self.start_timeout
+                )
+                silent = (
+                    worker.ready and now - worker.last_pong > 3 * self.health_interval
+                )
+                if stuck or silent or not worker.process.is_alive():
+                    logger.warning(f"Bot worker {worker.pid} unhealthy, replacing")
+                    draining = worker.draining
+                    self._retire(worker, graceful=False)
+                    # A draining worker already has its replacement.
+                    worker.draining = draining
+                elif worker.ready:
+                    try:
+                        worker.conn.send(("ping", now))
+                    except OSError:
+                        pass
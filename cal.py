@@ -1,43 +1,489 @@
-from typing import Iterable
+import os
+import sqlite3
+import threading
+from bisect import bisect_right
+from concurrent.futures import Future
+from time import monotonic
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Protocol,
+    Tuple,
+)
 from loguru import logger
 from gcsa.event import Event
 from gcsa.google_calendar import GoogleCalendar
-from datetime import date, timedelta, datetime
+from googleapiclient.errors import HttpError
 
+from holds import SlotHolds
+from datetime import date, time, timedelta, datetime
 
-def init_calendar(email_id: str) -> GoogleCalendar:
-    return GoogleCalendar(email_id)
+Interval = Tuple[datetime, datetime]
+# (event_id, start, end, summary)
+PendingEvent = Tuple[Optional[str], datetime, datetime, str]
+OpeningHours = Dict[int, Tuple[time, time]]
 
+VISIT_DURATION = timedelta(minutes=30)
+SLOT_STEP = timedelta(minutes=15)
+HORIZON = timedelta(weeks=2)
 
-def free_times(cal: GoogleCalendar) -> Iterable[str]:
+# Weekday (0 = Monday) -> (opening, closing) local time.
+DEFAULT_OPENING_HOURS: OpeningHours = {day: (time(9), time(18)) for day in range(5)}
 
+# Departments whose hours differ from the centre's default.
+department_hours: Dict[str, OpeningHours] = {
+    "Kinésithérapie": {day: (time(8), time(19)) for day in range(6)},
+    "Dentiste": {day: (time(9), time(17)) for day in range(4)},
+}
+
+
+class AvailabilityCache:
+    """Process-wide cache of calendar availability, shared by every session.
+
+    Entries live for `ttl` seconds. Once an entry is older than
+    `ttl * refresh_ahead` the next hit still answers from memory but kicks off
+    a background reload, so callers never wait on the calendar while the
+    entry is warm. Concurrent misses on the same key share a single load.
+    """
+
+    def __init__(self, ttl: float = 300.0, refresh_ahead: float = 0.8) -> None:
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self._loading: Dict[Hashable, Future] = {}
+        self._generations: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self.hits += 1
+                if (
+                    now - entry[0] >= self.ttl * self.refresh_ahead
+                    and key not in self._loading
+                ):
+                    self.refreshes += 1
+                    future, generation = self._begin_load(key)
+                    threading.Thread(
+                        target=self._load,
+                        args=(key, loader, generation, future),
+                        daemon=True,
+                    ).start()
+                return entry[1]
+            self.misses += 1
+            future = self._loading.get(key)
+            owner = future is None
+            if owner:
+                future, generation = self._begin_load(key)
+        if owner:
+            self._load(key, loader, generation, future)
+        return future.result()
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+            # Callers arriving after a booking must not join a load that
+            # started before it.
+            self._loading.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._entries) + list(self._loading):
+                self._generations[key] = self._generations.get(key, 0) + 1
+            self._entries.clear()
+            self._loading.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "entries": len(self._entries),
+            }
+
+    def _begin_load(self, key: Hashable) -> Tuple[Future, int]:
+        # Must be called with the lock held.
+        future: Future = Future()
+        self._loading[key] = future
+        return future, self._generations.get(key, 0)
+
+    def _load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Any],
+        generation: int,
+        future: Future,
+    ) -> None:
+        try:
+            value = loader()
+        except Exception as e:
+            logger.exception(f"Failed loading availability: {e}")
+            with self._lock:
+                if self._loading.get(key) is future:
+                    del self._loading[key]
+            future.set_exception(e)
+            return
+        with self._lock:
+            if self._loading.get(key) is future:
+                del self._loading[key]
+            # A booking written while we were loading makes this result stale.
+            if self._generations.get(key, 0) == generation:
+                self._entries[key] = (monotonic(), value)
+        future.set_result(value)
+
+
+def _local(value: Any) -> datetime:
+    # All-day events come back as dates; timed ones as aware datetimes.
+    if not isinstance(value, datetime):
+        return datetime.combine(value, time())
+    if value.tzinfo is not None:
+        # Cheaper than astimezone(), which re-resolves the local zone per call.
+        return datetime.fromtimestamp(value.timestamp())
+    return value
+
+
+class AvailabilityIndex:
+    """Busy intervals of a calendar window, merged and sorted for bisection.
+
+    Built once per calendar fetch. Queries cost a bisect plus the busy
+    intervals overlapping the days asked about, independent of how many
+    events the window holds overall.
+    """
+
+    def __init__(
+        self,
+        busy: Iterable[Interval],
+        opening_hours: Optional[OpeningHours] = None,
+        department_hours: Optional[Dict[str, OpeningHours]] = None,
+    ) -> None:
+        self.opening_hours = (
+            DEFAULT_OPENING_HOURS if opening_hours is None else opening_hours
+        )
+        self.department_hours = department_hours or {}
+        self._starts: List[datetime] = []
+        self._ends: List[datetime] = []
+        for start, end in sorted(busy):
+            if self._ends and start <= self._ends[-1]:
+                self._ends[-1] = max(self._ends[-1], end)
+            else:
+                self._starts.append(start)
+                self._ends.append(end)
+
+    @classmethod
+    def from_events(cls, events: Iterable[Event], **kwargs) -> "AvailabilityIndex":
+        return cls(
+            ((_local(event.start), _local(event.end)) for event in events), **kwargs
+        )
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def hours_for(self, department: Optional[str] = None) -> OpeningHours:
+        if department is None:
+            return self.opening_hours
+        return self.department_hours.get(department, self.opening_hours)
+
+    def is_free(self, start: datetime, end: datetime) -> bool:
+        i = bisect_right(self._ends, start)
+        return i == len(self._starts) or self._starts[i] >= end
+
+    def free_slots(
+        self,
+        start: datetime,
+        end: datetime,
+        duration: timedelta = VISIT_DURATION,
+        department: Optional[str] = None,
+        step: timedelta = SLOT_STEP,
+        limit: Optional[int] = None,
+    ) -> List[datetime]:
+        """Start times of free `duration` slots in [start, end), on the `step` grid."""
+        slots: List[datetime] = []
+        hours = self.hours_for(department)
+        day = start.date()
+        while day <= end.date() and (limit is None or len(slots) < limit):
+            if day.weekday() in hours:
+                opens, closes = hours[day.weekday()]
+                day_open = datetime.combine(day, opens)
+                window_end = min(end, datetime.combine(day, closes))
+                t = day_open
+                if t < start:
+                    # Round up onto the slot grid.
+                    t += -((day_open - start) // step) * step
+                i = bisect_right(self._ends, t)
+                while t + duration <= window_end:
+                    if i < len(self._starts) and self._starts[i] < t + duration:
+                        if self._ends[i] > t:
+                            t += -((t - self._ends[i]) // step) * step
+                        i += 1
+                        continue
+                    slots.append(t)
+                    if limit is not None and len(slots) >= limit:
+                        break
+                    t += step
+            day += timedelta(days=1)
+        return slots
+
+    def first_free_slot(
+        self,
+        start: datetime,
+        end: datetime,
+        duration: timedelta = VISIT_DURATION,
+        department: Optional[str] = None,
+    ) -> Optional[datetime]:
+        slots = self.free_slots(start, end, duration, department, limit=1)
+        return slots[0] if slots else None
+
+    def free_dates(
+        self,
+        start: datetime,
+        end: datetime,
+        duration: timedelta = VISIT_DURATION,
+        department: Optional[str] = None,
+    ) -> List[str]:
+        dates = []
+        day = start.date()
+        while day <= end.date():
+            day_start = max(start, datetime.combine(day, time()))
+            day_end = min(end, datetime.combine(day + timedelta(days=1), time()))
+            if (
+                self.first_free_slot(day_start, day_end, duration, department)
+                is not None
+            ):
+                dates.append(day.strftime("%Y-%m-%d"))
+            day += timedelta(days=1)
+        return dates
+
+
+availability_cache = AvailabilityCache()
+
+
+class CalendarBackend(Protocol):
+    """Where bookings live. free_times and create_event work on any backend."""
+
+    def get_busy(self, start: datetime, end: datetime) -> List[Interval]:
+        """Busy intervals overlapping [start, end), as naive local datetimes."""
+        ...
+
+    def add_event(
+        self,
+        start: datetime,
+        end: datetime,
+        summary: str,
+        event_id: Optional[str] = None,
+    ) -> None:
+        """Insert an event. Re-adding an existing `event_id` is a no-op."""
+        ...
+
+    def add_events(self, events: List["PendingEvent"]) -> None:
+        """Insert a batch of events, idempotently by `event_id`."""
+        ...
+
+
+class GoogleCalendarBackend:
+    """Google Calendar through gcsa. Authenticates on first use."""
+
+    def __init__(self, email_id: str) -> None:
+        self.email_id = email_id
+        self._cal: Optional[GoogleCalendar] = None
+        self._lock = threading.Lock()
+
+    @property
+    def cal(self) -> GoogleCalendar:
+        with self._lock:
+            if self._cal is None:
+                self._cal = GoogleCalendar(self.email_id)
+            return self._cal
+
+    def get_busy(self, start: datetime, end: datetime) -> List[Interval]:
+        return [
+            (_local(event.start), _local(event.end))
+            for event in self.cal.get_events(start, end)
+        ]
+
+    def add_event(
+        self,
+        start: datetime,
+        end: datetime,
+        summary: str,
+        event_id: Optional[str] = None,
+    ) -> None:
+        event = Event(summary=summary, start=start, end=end, event_id=event_id)
+        try:
+            self.cal.add_event(event)
+        except HttpError as e:
+            # 409: an earlier attempt already created this event.
+            if event_id is None or e.status_code != 409:
+                raise
+
+    def add_events(self, events: List[PendingEvent]) -> None:
+        for event_id, start, end, summary in events:
+            self.add_event(start, end, summary, event_id)
+
+
+class SQLiteCalendarBackend:
+    """Local calendar in SQLite, indexed by start time.
+
+    Use ":memory:" for load tests and benchmarks; a file path survives
+    restarts and can be shared by the worker processes of one host.
+    """
+
+    def __init__(self, path: str = ":memory:") -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY,
+                event_id TEXT UNIQUE,
+                start TEXT NOT NULL,
+                end TEXT NOT NULL,
+                summary TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS events_start ON events (start);
+            """)
+
+    def get_busy(self, start: datetime, end: datetime) -> List[Interval]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT start, end FROM events WHERE start < ? AND end > ?"
+                " ORDER BY start",
+                (end.isoformat(), start.isoformat()),
+            ).fetchall()
+        return [
+            (datetime.fromisoformat(row[0]), datetime.fromisoformat(row[1]))
+            for row in rows
+        ]
+
+    def add_event(
+        self,
+        start: datetime,
+        end: datetime,
+        summary: str,
+        event_id: Optional[str] = None,
+    ) -> None:
+        self.add_events([(event_id, start, end, summary)])
+
+    def add_events(self, events: List[PendingEvent]) -> None:
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO events (event_id, start, end, summary)"
+                " VALUES (?, ?, ?, ?)",
+                [
+                    (event_id, _local(start).isoformat(), _local(end).isoformat(), s)
+                    for event_id, start, end, s in events
+                ],
+            )
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def init_calendar(kind: Optional[str] = None) -> CalendarBackend:
+    kind = kind or os.getenv("CALENDAR_BACKEND") or "google"
+    if kind == "google":
+        return GoogleCalendarBackend(os.getenv("EMAIL_ID", ""))
+    if kind == "sqlite":
+        return SQLiteCalendarBackend(os.getenv("CALENDAR_DB") or "calendar.db")
+    raise ValueError(f"Unknown calendar backend: {kind}")
+
+
+def build_index(
+    cal: CalendarBackend, horizon: timedelta = HORIZON
+) -> AvailabilityIndex:
     today = datetime.now()
+    busy = cal.get_busy(today, today + horizon)
+    return AvailabilityIndex(busy, department_hours=department_hours)
+
+
+def cached_index(cal: CalendarBackend) -> AvailabilityIndex:
+    return availability_cache.get(cal, lambda: build_index(cal))
+
+
+def free_times(
+    cal: CalendarBackend,
+    department: Optional[str] = None,
+    index: Optional[AvailabilityIndex] = None,
+) -> Iterable[str]:
+    today = datetime.now()
+    if index is None:
+        index = build_index(cal)
+    return index.free_dates(today, today + HORIZON, VISIT_DURATION, department)
+
+
+def cached_free_times(
+    cal: CalendarBackend, department: Optional[str] = None
+) -> List[str]:
+    return list(free_times(cal, department, index=cached_index(cal)))
 
-    # Calculate two weeks from today
-    two_weeks_from_now = today + timedelta(weeks=2)
 
-    # Generate a list of dates from today to two weeks from now
-    available_dates = [
-        today + timedelta(days=i) for i in range((two_weeks_from_now - today).days + 1)
-    ]
+def next_free_slot(
+    cal: CalendarBackend, day: date, department: Optional[str] = None
+) -> Optional[datetime]:
+    start = max(datetime.now(), datetime.combine(day, time()))
+    end = datetime.combine(day + timedelta(days=1), time())
+    return cached_index(cal).first_free_slot(start, end, VISIT_DURATION, department)
 
-    events = cal.get_events(today, two_weeks_from_now)
-    event_dates = [event.start.strftime("%Y-%m-%d") for event in events]
 
-    # Convert the available dates back to strings (ISO format)
-    available_dates = [date.strftime("%Y-%m-%d") for date in available_dates]
+def book_visit(
+    cal: CalendarBackend,
+    day: date,
+    summary: str,
+    holds: Optional[SlotHolds] = None,
+    session: str = "",
+    department: Optional[str] = None,
+) -> Optional[datetime]:
+    """Book the first free slot on `day` that this session manages to hold.
 
-    # Filter out the event dates from the available dates
-    available_dates = [
-        date
-        for date in available_dates
-        if date not in [str(event) for event in event_dates]
-    ]
-    return available_dates
+    Candidates come from the cached index; the hold is what arbitrates between
+    concurrent callers, so a slot another worker just took is skipped rather
+    than double-booked.
+    """
+    start = max(datetime.now(), datetime.combine(day, time()))
+    end = datetime.combine(day + timedelta(days=1), time())
+    slots = cached_index(cal).free_slots(start, end, VISIT_DURATION, department)
+    if holds is None:
+        if not slots:
+            return None
+        create_event(cal, slots[0], summary)
+        return slots[0]
+    held = holds.hold_first([(slot, slot + VISIT_DURATION) for slot in slots], session)
+    if held is None:
+        return None
+    slot, slot_end = held
+    try:
+        create_event(cal, slot, summary)
+    except Exception:
+        holds.release(session, slot)
+        raise
+    holds.confirm(slot, slot_end, session)
+    return slot
 
 
-def create_event(cal: GoogleCalendar, start: date, summary: str) -> None:
+def create_event(
+    cal: CalendarBackend,
+    start: datetime,
+    summary: str,
+    duration: timedelta = VISIT_DURATION,
+) -> None:
     logger.debug("creating event")
-    event = Event(summary=summary, start=start)
-    cal.add_event(event)
+    try:
+        cal.add_event(start, start + duration, summary)
+    finally:
+        # Even a failed insert may have reached the calendar; never keep
+        # offering a slot we might just have booked.
+        availability_cache.invalidate(cal)
     logger.debug("Exiting function")
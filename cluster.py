@@ -0,0 +1,176 @@
+import sqlite3
+import threading
+from dataclasses import dataclass
+from time import time
+from typing import List, Optional, Tuple
+
+
+@dataclass
+class Node:
+    node_id: str
+    url: str
+    capacity: int
+    live: int
+    heartbeat: float
+
+    @property
+    def load(self) -> float:
+        return self.live / self.capacity if self.capacity else 1.0
+
+
+class NodeRegistry:
+    """Bot nodes and the sessions they run, shared by every server process.
+
+    Nodes register their URL and capacity and heartbeat their live session
+    count; a dispatcher places each call on the least-loaded live node. The
+    placement reserves a slot in the same IMMEDIATE transaction that picks
+    the node, so concurrent dispatchers never overfill one. A SQLite file is
+    the local stand-in for a shared store such as Redis.
+    """
+
+    def __init__(
+        self,
+        path: str = "cluster.db",
+        node_ttl: float = 10.0,
+        session_retention: float = 24 * 60 * 60,
+    ) -> None:
+        self.path = path
+        self.node_ttl = node_ttl
+        self.session_retention = session_retention
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path, check_same_thread=False, timeout=30, isolation_level=None
+        )
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS nodes (
+                node_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                capacity INTEGER NOT NULL,
+                live INTEGER NOT NULL DEFAULT 0,
+                heartbeat REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS sessions (
+                bot_id TEXT PRIMARY KEY,
+                node_id TEXT NOT NULL,
+                room_url TEXT NOT NULL,
+                status TEXT NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated);
+            """)
+
+    def register(self, node_id: str, url: str, capacity: int) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO nodes (node_id, url, capacity, live, heartbeat)"
+                " VALUES (?, ?, ?, 0, ?)",
+                (node_id, url, capacity, time()),
+            )
+
+    def heartbeat(self, node_id: str, live: int, capacity: int) -> None:
+        """Report the node's real load; overwrites slots reserved since."""
+        now = time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE nodes SET live = ?, capacity = ?, heartbeat = ?"
+                " WHERE node_id = ?",
+                (live, capacity, now, node_id),
+            )
+            self._db.execute(
+                "DELETE FROM sessions WHERE status != 'running' AND updated < ?",
+                (now - self.session_retention,),
+            )
+
+    def deregister(self, node_id: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM nodes WHERE node_id = ?", (node_id,))
+
+    def nodes(self) -> List[Node]:
+        """Nodes that heartbeat within `node_ttl`."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT node_id, url, capacity, live, heartbeat FROM nodes"
+                " WHERE heartbeat > ? ORDER BY node_id",
+                (time() - self.node_ttl,),
+            ).fetchall()
+        return [Node(*row) for row in rows]
+
+    def place(self, exclude: Tuple[str, ...] = ()) -> Optional[Node]:
+        """Reserve a slot on the least-loaded live node with room to spare."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT node_id, url, capacity, live, heartbeat FROM nodes"
+                    " WHERE heartbeat > ? AND live < capacity"
+                    f" AND node_id NOT IN ({', '.join('?' * len(exclude))})"
+                    " ORDER BY CAST(live AS REAL) / capacity, live, node_id LIMIT 1",
+                    (time() - self.node_ttl, *exclude),
+                ).fetchone()
+                if row:
+                    self._db.execute(
+                        "UPDATE nodes SET live = live + 1 WHERE node_id = ?",
+                        (row[0],),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return Node(*row) if row else None
+
+    def unplace(self, node_id: str) -> None:
+        """Give back a reservation the node turned down."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE nodes SET live = MAX(live - 1, 0) WHERE node_id = ?",
+                (node_id,),
+            )
+
+    def get_node(self, node_id: str) -> Optional[Node]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT node_id, url, capacity, live, heartbeat FROM nodes"
+                " WHERE node_id = ?",
+                (node_id,),
+            ).fetchone()
+        return Node(*row) if row else None
+
+    def record_session(self, bot_id: str, node_id: str, room_url: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions"
+                " (bot_id, node_id, room_url, status, updated)"
+                " VALUES (?, ?, ?, 'running', ?)",
+                (bot_id, node_id, room_url, time()),
+            )
+
+    def finish_session(self, bot_id: str, status: str = "finished") -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE sessions SET status = ?, updated = ? WHERE bot_id = ?",
+                (status, time(), bot_id),
+            )
+
+    def locate(self, bot_id: str) -> Optional[Tuple[str, str]]:
+        """(node_id, status) of a session anywhere in the cluster.
+
+        A running session on a node that stopped heartbeating is "lost".
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT s.node_id, s.status, n.heartbeat FROM sessions s"
+                " LEFT JOIN nodes n ON n.node_id = s.node_id WHERE s.bot_id = ?",
+                (bot_id,),
+            ).fetchone()
+        if not row:
+            return None
+        node_id, status, heartbeat = row
+        if status == "running" and (heartbeat or 0) <= time() - self.node_ttl:
+            status = "lost"
+        return node_id, status
+
+    def close(self) -> None:
+        self._db.close()
@@ -0,0 +1,218 @@
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from pipecat.processors.aggregators.openai_llm_context import (
+    OpenAILLMContext,
+    OpenAILLMContextFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+from pipecat.frames.frames import Frame
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("o200k_base")  # gpt-4o
+except Exception:  # not installed, or no cached encoding offline
+    _encoding = None
+
+SUMMARY_PREFIX = "Informations déjà recueillies auprès du patient (ne pas redemander) :"
+
+# Per-message overhead of the chat format, as counted by OpenAI.
+_MESSAGE_TOKENS = 4
+
+
+def count_text(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def count_tokens(messages: List[Dict[str, Any]], tools: Any = None) -> int:
+    """Prompt tokens of a chat request; an estimate without tiktoken."""
+    total = 0
+    for message in messages:
+        total += _MESSAGE_TOKENS + count_text(str(message.get("content") or ""))
+        for call in message.get("tool_calls") or []:
+            total += count_text(call["function"]["name"])
+            total += count_text(call["function"]["arguments"])
+    if isinstance(tools, list) and tools:
+        total += count_text(json.dumps(tools, ensure_ascii=False))
+    return total
+
+
+def summary_message(details: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        "role": "system",
+        "content": f"{SUMMARY_PREFIX} {json.dumps(details, ensure_ascii=False)}",
+    }
+
+
+def _is_summary(message: Dict[str, Any]) -> bool:
+    return message.get("role") == "system" and str(
+        message.get("content") or ""
+    ).startswith(SUMMARY_PREFIX)
+
+
+def _last_exchange(messages: List[Dict[str, Any]], end: int) -> List[Dict[str, Any]]:
+    """The tool call and its results that end just before `end`, if any."""
+    start = end
+    while start > 0 and messages[start - 1].get("role") == "tool":
+        start -= 1
+    if start == end or start == 0 or not messages[start - 1].get("tool_calls"):
+        return []
+    return messages[start - 1 : end]
+
+
+def compact_messages(
+    messages: List[Dict[str, Any]],
+    role_contents: List[str],
+    task_contents: List[str],
+    details: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    """Messages for the current node only, with earlier nodes summarised.
+
+    Keeps the role prompt, a summary of `details` (what earlier nodes
+    collected), the tool exchange that led into the current node (it may
+    carry data the node needs, like the offered dates) and everything from
+    the node's task message on. Unchanged if the task message is not in the
+    context yet.
+    """
+    boundary = None
+    for i in range(len(messages) - 1, -1, -1):
+        if (
+            messages[i].get("role") == "system"
+            and messages[i].get("content") in task_contents
+        ):
+            boundary = i
+            break
+    if boundary is None:
+        return messages
+
+    head, seen = [], set()
+    for message in messages[:boundary]:
+        content = message.get("content")
+        if message.get("role") == "system" and content in role_contents:
+            if content not in seen:
+                seen.add(content)
+                head.append(message)
+    if details:
+        head.append(summary_message(details))
+    return head + _last_exchange(messages, boundary) + messages[boundary:]
+
+
+class TokenReport:
+    """Prompt tokens sent per node, and what the uncompacted context would cost."""
+
+    def __init__(self) -> None:
+        self.nodes: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, node: Optional[str], prompt: int, uncompacted: int) -> None:
+        with self._lock:
+            stats = self.nodes.setdefault(
+                node or "none",
+                {"calls": 0, "prompt": 0, "max_prompt": 0, "uncompacted": 0},
+            )
+            stats["calls"] += 1
+            stats["prompt"] += prompt
+            stats["max_prompt"] = max(stats["max_prompt"], prompt)
+            stats["uncompacted"] += uncompacted
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """{node: {calls, mean_prompt, max_prompt, mean_uncompacted, saved_pct}}."""
+        summary = {}
+        for node, stats in sorted(self.nodes.items()):
+            calls = stats["calls"]
+            summary[node] = {
+                "calls": calls,
+                "mean_prompt": round(stats["prompt"] / calls),
+                "max_prompt": stats["max_prompt"],
+                "mean_uncompacted": round(stats["uncompacted"] / calls),
+                "saved_pct": round(
+                    100 * (1 - stats["prompt"] / max(1, stats["uncompacted"])), 1
+                ),
+            }
+        return summary
+
+    def log_summary(self) -> None:
+        for node, stats in self.summary().items():
+            logger.debug(f"Prompt tokens [{node}]: {stats}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self.nodes.clear()
+
+
+token_report = TokenReport()
+
+
+class ContextCompactor(FrameProcessor):
+    """Sits before the LLM and compacts the context of every request it sees.
+
+    Completed nodes are replaced by a summary of the session's patient
+    details, so prompts stay about the same size all through the flow
+    instead of carrying every earlier turn and tool payload. With
+    `enabled=False` it only counts tokens, for comparison.
+    """
+
+    def __init__(
+        self,
+        flow_config: Dict[str, Any],
+        details: Callable[[], Dict[str, Any]],
+        node: Callable[[], Optional[str]],
+        report: TokenReport = token_report,
+        enabled: bool = True,
+    ) -> None:
+        super().__init__()
+        self._details = details
+        self._node = node
+        self._report = report
+        self._enabled = enabled
+        self._role_contents = [
+            message["content"]
+            for message in flow_config.get("initial_system_message") or []
+        ] + [
+            message["content"]
+            for node_config in flow_config["nodes"].values()
+            for message in node_config.get("role_messages") or []
+        ]
+        self._task_contents = {
+            name: [message["content"] for message in node_config["task_messages"]]
+            for name, node_config in flow_config["nodes"].items()
+        }
+        self._dropped = 0  # tokens compacted away so far
+
+    def compact(self, context: OpenAILLMContext) -> None:
+        node = self._node()
+        if self._enabled and node in self._task_contents:
+            messages = compact_messages(
+                context.messages,
+                self._role_contents,
+                self._task_contents[node],
+                self._details(),
+            )
+            if messages is not context.messages:
+                kept = {id(message) for message in messages}
+                self._dropped += count_tokens(
+                    [
+                        message
+                        for message in context.messages
+                        if id(message) not in kept and not _is_summary(message)
+                    ]
+                )
+                context.set_messages(messages)
+        prompt = count_tokens(context.messages, context.tools)
+        uncompacted = prompt + self._dropped
+        for message in context.messages:
+            if _is_summary(message):
+                uncompacted -= count_tokens([message])
+        self._report.record(node, prompt, uncompacted)
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, OpenAILLMContextFrame):
+            self.compact(frame.context)
+        await self.push_frame(frame, direction)
@@ -0,0 +1,144 @@
+import sqlite3
+import threading
+from bisect import bisect_right
+from itertools import accumulate
+from datetime import datetime
+from time import time
+from typing import List, Optional, Tuple
+
+
+def _first_free(
+    slots: List[Tuple[datetime, datetime]], taken: List[Tuple[datetime, datetime]]
+) -> Optional[Tuple[datetime, datetime]]:
+    # Both lists are sorted by start; `taken` may overlap itself.
+    ends = list(accumulate((end for _, end in taken), max))
+    for start, end in slots:
+        i = bisect_right(ends, start)
+        if i == len(taken) or taken[i][0] >= end:
+            return start, end
+    return None
+
+
+class SlotHolds:
+    """Short-lived reservations on calendar slots, shared by the workers of a host.
+
+    A hold is taken atomically: the overlap check and the insert run in one
+    IMMEDIATE transaction on a shared SQLite file, so two processes can never
+    both hold overlapping slots. Unconfirmed holds lapse after their TTL (a
+    crashed session can't keep a slot); confirmed ones stay until the slot
+    has passed, covering the time other workers still serve availability
+    cached from before the booking.
+    """
+
+    def __init__(self, path: str = "holds.db", ttl: float = 120.0) -> None:
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path, check_same_thread=False, timeout=30, isolation_level=None
+        )
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS holds (
+                start TEXT PRIMARY KEY,
+                end TEXT NOT NULL,
+                session TEXT NOT NULL,
+                expires REAL NOT NULL,
+                confirmed INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS holds_expires ON holds (expires);
+            """)
+
+    def hold(
+        self,
+        start: datetime,
+        end: datetime,
+        session: str,
+        ttl: Optional[float] = None,
+    ) -> bool:
+        """Reserve [start, end) for `session`. False if someone else holds it."""
+        return self.hold_first([(start, end)], session, ttl) is not None
+
+    def hold_first(
+        self,
+        slots: List[Tuple[datetime, datetime]],
+        session: str,
+        ttl: Optional[float] = None,
+    ) -> Optional[Tuple[datetime, datetime]]:
+        """Hold the first of the sorted `slots` nobody else holds, in one transaction."""
+        if not slots:
+            return None
+        now = time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM holds WHERE expires <= ?", (now,))
+                rows = self._db.execute(
+                    "SELECT start, end FROM holds"
+                    " WHERE start < ? AND end > ? AND session != ? ORDER BY start",
+                    (
+                        max(end for _, end in slots).isoformat(),
+                        slots[0][0].isoformat(),
+                        session,
+                    ),
+                ).fetchall()
+                taken = [
+                    (datetime.fromisoformat(start), datetime.fromisoformat(end))
+                    for start, end in rows
+                ]
+                chosen = _first_free(slots, taken)
+                if chosen is not None:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO holds (start, end, session, expires)"
+                        " VALUES (?, ?, ?, ?)",
+                        (
+                            chosen[0].isoformat(),
+                            chosen[1].isoformat(),
+                            session,
+                            now + (self.ttl if ttl is None else ttl),
+                        ),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return chosen
+
+    def confirm(self, start: datetime, end: datetime, session: str) -> bool:
+        """Turn a live hold into a booking. False if it lapsed or isn't ours."""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE holds SET confirmed = 1, expires = MAX(expires, ?)"
+                " WHERE start = ? AND session = ? AND expires > ?",
+                (end.timestamp(), start.isoformat(), session, time()),
+            )
+        return cursor.rowcount == 1
+
+    def release(self, session: str, start: Optional[datetime] = None) -> None:
+        """Drop `session`'s unconfirmed holds (or only the one at `start`)."""
+        query = "DELETE FROM holds WHERE session = ? AND confirmed = 0"
+        params: Tuple = (session,)
+        if start is not None:
+            query += " AND start = ?"
+            params += (start.isoformat(),)
+        with self._lock:
+            self._db.execute(query, params)
+
+    def held(
+        self, start: datetime, end: datetime, exclude_session: Optional[str] = None
+    ) -> List[Tuple[datetime, datetime]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT start, end FROM holds"
+                " WHERE start < ? AND end > ? AND expires > ? AND session != ?",
+                (end.isoformat(), start.isoformat(), time(), exclude_session or ""),
+            ).fetchall()
+        return [
+            (datetime.fromisoformat(row[0]), datetime.fromisoformat(row[1]))
+            for row in rows
+        ]
+
+    def close(self) -> None:
+        self._db.close()
@@ -0,0 +1,194 @@
+import functools
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    Frame,
+    FunctionCallInProgressFrame,
+    TextFrame,
+    TranscriptionFrame,
+    TTSAudioRawFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from metrics import Histogram
+
+# Milestones of a turn, in pipeline order, timed from the end of user speech.
+STAGES = (
+    "transcript",
+    "llm_first_token",
+    "function_call",
+    "tts_first_audio",
+    "audio_out",
+)
+
+# Exact frame types only: a type lookup per frame keeps the taps cheap on the
+# audio path, and subclasses (TranscriptionFrame is a TextFrame) stay apart.
+FRAME_STAGES = {
+    UserStartedSpeakingFrame: "vad_start",
+    UserStoppedSpeakingFrame: "vad_end",
+    TranscriptionFrame: "transcript",
+    TextFrame: "llm_first_token",
+    FunctionCallInProgressFrame: "function_call",
+    TTSAudioRawFrame: "tts_first_audio",
+    BotStartedSpeakingFrame: "audio_out",
+}
+
+
+@dataclass
+class TurnRecord:
+    session_id: str
+    node: Optional[str]
+    started_at: float
+    marks: Dict[str, float] = field(default_factory=dict)  # stage -> seconds
+    handlers: Dict[str, float] = field(default_factory=dict)  # name -> seconds
+
+
+class LatencyRecorder:
+    """Recent turns in a ring buffer plus histograms per (stage, node)."""
+
+    def __init__(self, capacity: int = 1000) -> None:
+        self.turns: Deque[TurnRecord] = deque(maxlen=capacity)
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage: str, node: Optional[str]) -> Histogram:
+        key = (stage, node or "none")
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        return histogram
+
+    def record_turn(self, turn: TurnRecord) -> None:
+        self.turns.append(turn)
+        for stage, seconds in turn.marks.items():
+            self.histogram(stage, turn.node).observe(seconds)
+
+    def record_handler(self, name: str, node: Optional[str], seconds: float) -> None:
+        self.histogram(f"handler:{name}", node).observe(seconds)
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """{stage: {node: {count, mean_ms, p50_ms, p95_ms}}}."""
+        summary: Dict[str, Dict[str, Dict[str, float]]] = {}
+        for (stage, node), histogram in sorted(self.histograms.items()):
+            summary.setdefault(stage, {})[node] = histogram.summary()
+        return summary
+
+    def slowest(self, stage: str = "audio_out", n: int = 5) -> List[Tuple[str, float]]:
+        """Nodes with the highest p95 for `stage`, in seconds."""
+        ranked = [
+            (node, histogram.quantile(0.95))
+            for (s, node), histogram in self.histograms.items()
+            if s == stage and histogram.count
+        ]
+        return sorted(ranked, key=lambda item: item[1], reverse=True)[:n]
+
+    def log_summary(self) -> None:
+        for stage, nodes in self.summary().items():
+            for node, stats in nodes.items():
+                logger.debug(f"Latency {stage} [{node}]: {stats}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self.turns.clear()
+            self.histograms.clear()
+
+
+latency_recorder = LatencyRecorder()
+
+
+class TurnTracker:
+    """Times the turns of one call from the frames its taps see.
+
+    A turn opens when the user stops speaking and closes when the bot's
+    audio starts playing; each stage keeps its first timestamp only. A final
+    transcript that arrived before VAD ended counts as 0.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        recorder: LatencyRecorder = latency_recorder,
+        node: Callable[[], Optional[str]] = lambda: None,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        self.session_id = session_id
+        self.recorder = recorder
+        self.node = node
+        self.clock = clock
+        self.turn: Optional[TurnRecord] = None
+        self._early_transcript = False
+
+    def mark(self, stage: str) -> None:
+        now = self.clock()
+        if stage == "vad_start":
+            self._early_transcript = False
+        elif stage == "vad_end":
+            self.finish()
+            self.turn = TurnRecord(self.session_id, self.node(), now)
+            if self._early_transcript:
+                self.turn.marks["transcript"] = 0.0
+        elif self.turn is None:
+            if stage == "transcript":
+                self._early_transcript = True
+        elif stage not in self.turn.marks:
+            self.turn.marks[stage] = now - self.turn.started_at
+            if stage == "audio_out":
+                self.finish()
+
+    def finish(self) -> None:
+        """Record the open turn, complete or not."""
+        if self.turn is not None:
+            self.recorder.record_turn(self.turn)
+            self.turn = None
+            self._early_transcript = False
+
+    def timed(self, name: str, handler: Callable) -> Callable:
+        """Wrap an async flow handler so its duration lands in the turn."""
+
+        @functools.wraps(handler)
+        async def wrapper(*args: Any) -> Any:
+            started = self.clock()
+            try:
+                return await handler(*args)
+            finally:
+                seconds = self.clock() - started
+                node = self.turn.node if self.turn else self.node()
+                if self.turn is not None:
+                    self.turn.handlers[name] = seconds
+                self.recorder.record_handler(name, node, seconds)
+
+        return wrapper
+
+    def tap(self, *stages: str) -> "LatencyTap":
+        return LatencyTap(self, stages)
+
+
+class LatencyTap(FrameProcessor):
+    """Pass-through processor that reports the frames of `stages` it sees."""
+
+    def __init__(self, tracker: TurnTracker, stages: Tuple[str, ...]) -> None:
+        super().__init__()
+        self._tracker = tracker
+        self._marks = {
+            frame_type: stage
+            for frame_type, stage in FRAME_STAGES.items()
+            if stage in stages
+        }
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if direction == FrameDirection.DOWNSTREAM:
+            stage = self._marks.get(type(frame))
+            if stage:
+                self._tracker.mark(stage)
+        await self.push_frame(frame, direction)
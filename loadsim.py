@@ -0,0 +1,654 @@
+"""Offline load simulator for the intake flow.
+
+    python loadsim.py [--sessions 200] [--concurrency 100] [--time-scale 1]
+
+Runs the real flow_config through FlowManager, many sessions in one process,
+with scripted patients in place of callers: mock STT, LLM and TTS services
+answer from a persona with fixed delays, and bookings go to an in-memory
+SQLite calendar. Reports sessions/s, per-node turn latency (end of patient
+speech to first bot audio) and handler latency, event-loop lag and memory
+per live session. --time-scale shrinks or stretches every simulated delay.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+from dataclasses import dataclass
+from time import monotonic, sleep
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    CancelFrame,
+    EndFrame,
+    Frame,
+    TextFrame,
+    TranscriptionFrame,
+    TTSAudioRawFrame,
+    TTSStartedFrame,
+    TTSStoppedFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.pipeline.pipeline import Pipeline
+from pipecat.pipeline.runner import PipelineRunner
+from pipecat.pipeline.task import PipelineParams, PipelineTask
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+from pipecat.services.ai_services import TTSService
+from pipecat.services.openai import OpenAILLMService
+from pipecat_flows import FlowManager
+
+import patient_flow
+from async_cal import AsyncCalendar
+from cal import SQLiteCalendarBackend, availability_cache
+from compaction import ContextCompactor, TokenReport
+from holds import SlotHolds
+from latency import LatencyRecorder, TurnTracker
+from metrics import Histogram, process_usage
+from patient_flow import (
+    IntakeSession,
+    create_flow_config,
+    flow_config,
+    handle_transition,
+)
+
+
+@dataclass
+class Timings:
+    """Simulated delays, in seconds."""
+
+    think: float = 0.3  # patient pause before answering
+    speech: float = 1.0  # patient speaking, VAD start to VAD end
+    stt: float = 0.15  # end of speech to final transcript
+    llm_first_token: float = 0.35
+    tts_first_audio: float = 0.1
+    calendar: float = 0.05  # per backend call
+
+    def scaled(self, factor: float) -> "Timings":
+        return Timings(**{k: v * factor for k, v in self.__dict__.items()})
+
+
+@dataclass
+class Persona:
+    name: str
+    date_of_birth: str
+    prescriptions: List[Dict[str, str]]
+    allergies: List[Dict[str, str]]
+    conditions: List[Dict[str, str]]
+    visit_reasons: List[Dict[str, str]]
+    date_choice: int = 0  # index into the dates the bot offers
+
+    def answer(self, node: Optional[str]) -> str:
+        """What the patient says when asked the question of `node`."""
+
+        def listed(items: List[Dict[str, str]], key: str = "name") -> str:
+            return ", ".join(item[key] for item in items) or "non, rien"
+
+        if node == "start":
+            return f"Je m'appelle {self.name}, je suis né le {self.date_of_birth}"
+        if node == "get_prescriptions":
+            return listed(self.prescriptions, "medication")
+        if node == "get_allergies":
+            return listed(self.allergies)
+        if node == "get_conditions":
+            return listed(self.conditions)
+        if node == "get_visit_reasons":
+            return listed(self.visit_reasons)
+        if node == "get_user_visit_date":
+            return "La date numéro {} me convient".format(self.date_choice + 1)
+        return "D'accord"
+
+    def arguments(self, function: str, dates: List[str]) -> Dict[str, Any]:
+        """What a well-behaved LLM would extract from the patient's answer."""
+        if function == "record_personal_details":
+            return {"name": self.name, "date_of_birth": self.date_of_birth}
+        if function == "record_user_visit_date":
+            return {"visit_date": dates[self.date_choice % len(dates)]}
+        if function in (
+            "record_prescriptions",
+            "record_allergies",
+            "record_conditions",
+            "record_visit_reasons",
+        ):
+            key = function.split("_", 1)[1]
+            return {key: getattr(self, key)}
+        return {}
+
+
+_FIRST_NAMES = ["Camille", "Louis", "Léa", "Hugo", "Chloé", "Jules", "Manon", "Nathan"]
+_LAST_NAMES = ["Martin", "Bernard", "Dubois", "Thomas", "Robert", "Petit", "Durand"]
+_MEDICATIONS = [
+    ("Doliprane", "1000 mg"),
+    ("Levothyrox", "50 µg"),
+    ("Ventoline", "100 µg"),
+]
+_ALLERGIES = ["pollen", "pénicilline", "arachide", "acariens"]
+_CONDITIONS = ["asthme", "hypertension", "diabète de type 2"]
+_REASONS = ["douleur à la poitrine", "mal de dos", "carie", "essoufflement"]
+
+
+def make_personas(count: int, seed: int = 0) -> List[Persona]:
+    """`count` reproducible patients with between zero and two of everything."""
+    rng = random.Random(seed)
+
+    def some(values: List[Any]) -> List[Any]:
+        return rng.sample(values, rng.randrange(3))
+
+    return [
+        Persona(
+            name=f"{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)}",
+            date_of_birth=f"{rng.randrange(1940, 2005)}-{rng.randrange(1, 13):02d}-"
+            f"{rng.randrange(1, 29):02d}",
+            prescriptions=[
+                {"medication": m, "dosage": d} for m, d in some(_MEDICATIONS)
+            ],
+            allergies=[{"name": a} for a in some(_ALLERGIES)],
+            conditions=[{"name": c} for c in some(_CONDITIONS)],
+            visit_reasons=[{"name": rng.choice(_REASONS)}],
+            date_choice=rng.randrange(5),
+        )
+        for _ in range(count)
+    ]
+
+
+# Function name -> node that offers it, and the function that closes each node.
+FUNCTION_NODES = {
+    function["function"]["name"]: node
+    for node, config in flow_config["nodes"].items()
+    for function in config["functions"]
+}
+NODE_FUNCTIONS = {node: name for name, node in FUNCTION_NODES.items()}
+
+QUESTIONS = {
+    "start": "Bonjour, je suis Jérome. Quels sont votre nom et votre date de naissance ?",
+    "get_prescriptions": "Prenez-vous des médicaments sur ordonnance ?",
+    "get_allergies": "Avez-vous des allergies ?",
+    "get_conditions": "Avez-vous des problèmes de santé ?",
+    "get_visit_reasons": "Qu'est-ce qui vous amène chez le médecin ?",
+    "get_user_visit_date": "Nous avons de la place le {dates}. Quelle date préférez-vous ?",
+    "confirm": "Votre rendez-vous est bien pris en compte, merci.",
+    "end": "Merci pour votre temps, au revoir.",
+}
+
+
+class MockSTTService(FrameProcessor):
+    """Stands in for transport input, VAD and STT: speaks the patient's lines."""
+
+    def __init__(self, timings: Timings) -> None:
+        super().__init__()
+        self._timings = timings
+        self._speaking: Optional[asyncio.Task] = None
+
+    def hear(self, text: str) -> None:
+        self._speaking = asyncio.create_task(self._speak(text))
+
+    async def _speak(self, text: str) -> None:
+        await asyncio.sleep(self._timings.think)
+        await self.push_frame(UserStartedSpeakingFrame())
+        await asyncio.sleep(self._timings.speech)
+        await self.push_frame(UserStoppedSpeakingFrame())
+        await asyncio.sleep(self._timings.stt)
+        await self.push_frame(TranscriptionFrame(text, "patient", ""))
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, (EndFrame, CancelFrame)) and self._speaking:
+            self._speaking.cancel()
+        await self.push_frame(frame, direction)
+
+
+class MockLLMService(OpenAILLMService):
+    """Answers every context the way a compliant model would, from a persona.
+
+    Questions go out as text; once the patient has answered, the node's
+    function is called with the persona's details. Nodes that need no input
+    (fetching dates, confirming) call their function straight away.
+    """
+
+    def __init__(self, persona: Persona, timings: Timings) -> None:
+        super().__init__(api_key="simulated", model="simulated")
+        self._persona = persona
+        self._timings = timings
+        self._called: set = set()
+        self._ids = itertools.count()
+
+    async def _process_context(self, context: OpenAILLMContext):
+        await asyncio.sleep(self._timings.llm_first_token)
+        node = await self._current_node(context)
+        messages = context.messages
+        last = messages[-1] if messages else {}
+        if last.get("role") == "user" and node in NODE_FUNCTIONS:
+            name = NODE_FUNCTIONS[node]
+            if node == "get_visit_reasons":
+                name = "get_departments"
+            await self._call(context, name)
+        elif last.get("role") == "tool" and _tool_name(messages) == "get_departments":
+            await self._call(context, "record_visit_reasons")
+        elif node == "get_available_dates":
+            await self._call(context, "get_available_dates")
+        elif node == "confirm":
+            await self._say(QUESTIONS[node])
+            await self._call(context, "complete_intake")
+        elif node in QUESTIONS:
+            dates = ", ".join(_offered_dates(messages)[:5])
+            await self._say(QUESTIONS[node].format(dates=dates))
+
+    async def _current_node(self, context: OpenAILLMContext) -> Optional[str]:
+        # The new node's tools are queued at the head of the pipeline when a
+        # function returns and can trail the context frame by a hop or two.
+        for _ in range(100):
+            tools = context.tools if isinstance(context.tools, list) else None
+            if tools is None:
+                return None
+            names = [tool["function"]["name"] for tool in tools]
+            if not names:
+                return "end"
+            if names[-1] not in self._called:
+                return FUNCTION_NODES[names[-1]]
+            await asyncio.sleep(0.001)
+        return None
+
+    async def _say(self, text: str) -> None:
+        for word in text.split(" "):
+            await self.push_frame(TextFrame(word + " "))
+
+    async def _call(self, context: OpenAILLMContext, name: str) -> None:
+        self._called.add(name)
+        await self.call_function(
+            context=context,
+            tool_call_id=f"call_{next(self._ids)}",
+            function_name=name,
+            arguments=self._persona.arguments(name, _offered_dates(context.messages)),
+            run_llm=False,
+        )
+
+
+def _tool_name(messages: List[Dict[str, Any]]) -> Optional[str]:
+    """Name of the function whose result is the last message."""
+    for message in reversed(messages[:-1]):
+        for call in message.get("tool_calls") or []:
+            if call["id"] == messages[-1].get("tool_call_id"):
+                return call["function"]["name"]
+    return None
+
+
+def _tool_results(messages: List[Dict[str, Any]], name: str) -> List[Dict[str, Any]]:
+    ids = {
+        call["id"]
+        for message in messages
+        for call in message.get("tool_calls") or []
+        if call["function"]["name"] == name
+    }
+    return [
+        json.loads(message["content"])
+        for message in messages
+        if message.get("role") == "tool" and message.get("tool_call_id") in ids
+    ]
+
+
+def _offered_dates(messages: List[Dict[str, Any]]) -> List[str]:
+    results = _tool_results(messages, "get_available_dates")
+    return list(results[-1].get("dates", [])) if results else []
+
+
+class MockTTSService(TTSService):
+    """Silence, 20 ms per frame, about as long as the sentence would take to say."""
+
+    def __init__(self, timings: Timings, sample_rate: int = 16000) -> None:
+        super().__init__(sample_rate=sample_rate)
+        self._timings = timings
+        self._chunk = b"\0\0" * (sample_rate // 50)
+
+    def can_generate_metrics(self) -> bool:
+        return False
+
+    async def set_model(self, model: str):
+        pass
+
+    def set_voice(self, voice: str):
+        pass
+
+    async def flush_audio(self):
+        pass
+
+    async def run_tts(self, text: str) -> AsyncGenerator[Frame, None]:
+        yield TTSStartedFrame()
+        await asyncio.sleep(self._timings.tts_first_audio)
+        # ~65 ms of speech per character
+        for _ in range(max(1, len(text) * 65 // 20)):
+            yield TTSAudioRawFrame(self._chunk, self.sample_rate, 1)
+        yield TTSStoppedFrame()
+
+
+class PatientSink(FrameProcessor):
+    """Stands in for transport output: the patient answers each question heard."""
+
+    def __init__(
+        self, stt: MockSTTService, persona: Persona, node: Callable[[], Optional[str]]
+    ) -> None:
+        super().__init__()
+        self._stt = stt
+        self._persona = persona
+        self._node = node
+        self._speaking = False
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, TTSAudioRawFrame) and not self._speaking:
+            self._speaking = True
+            await self.push_frame(BotStartedSpeakingFrame())
+        elif isinstance(frame, TTSStoppedFrame):
+            self._speaking = False
+        elif type(frame) is TextFrame and frame.text.rstrip().endswith("?"):
+            self._stt.hear(self._persona.answer(self._node()))
+        await self.push_frame(frame, direction)
+
+
+@dataclass
+class SessionResult:
+    session_id: str
+    completed: bool
+    booked: bool
+    seconds: float
+    last_node: Optional[str]
+
+
+async def run_session(
+    persona: Persona,
+    timings: Timings,
+    recorder: LatencyRecorder,
+    tokens: Optional[TokenReport] = None,
+    compaction: bool = True,
+    timeout: float = 300,
+) -> SessionResult:
+    """One scripted call through the same pipeline shape as run_bot()."""
+    session = IntakeSession()
+    flow_manager = None
+    tracker = TurnTracker(
+        session.session_id,
+        recorder,
+        node=lambda: flow_manager.current_node if flow_manager else None,
+    )
+    stt = MockSTTService(timings)
+    llm = MockLLMService(persona, timings)
+    tts = MockTTSService(timings)
+    context = OpenAILLMContext()
+    context_aggregator = llm.create_context_aggregator(context)
+    config = create_flow_config(session, tracker)
+    compactor = ContextCompactor(
+        config,
+        details=lambda: session.patient_details,
+        node=lambda: flow_manager.current_node if flow_manager else None,
+        report=tokens if tokens is not None else TokenReport(),
+        enabled=compaction,
+    )
+    pipeline = Pipeline(
+        [
+            stt,
+            tracker.tap("vad_start", "vad_end"),
+            tracker.tap("transcript"),
+            context_aggregator.user(),
+            compactor,
+            llm,
+            tracker.tap("llm_first_token", "function_call"),
+            tts,
+            tracker.tap("tts_first_audio"),
+            PatientSink(stt, persona, lambda: flow_manager.current_node),
+            tracker.tap("audio_out"),
+            context_aggregator.assistant(),
+        ]
+    )
+    task = PipelineTask(pipeline, PipelineParams(allow_interruptions=True))
+    flow_manager = FlowManager(
+        task=task,
+        llm=llm,
+        tts=tts,
+        flow_config=config,
+        transition_callback=handle_transition,
+    )
+
+    started = monotonic()
+    runner = PipelineRunner(handle_sigint=False)
+    run = asyncio.create_task(runner.run(task))
+    completed = False
+    try:
+        await flow_manager.initialize()
+        await task.queue_frames([context_aggregator.user().get_context_frame()])
+        await asyncio.wait_for(asyncio.shield(run), timeout)
+        completed = flow_manager.current_node == "end"
+    except asyncio.TimeoutError:
+        logger.warning(
+            f"Session {session.session_id} stalled in {flow_manager.current_node}"
+        )
+        await task.cancel()
+        await run
+    finally:
+        # PipelineTask (0.0.51) never cleans up its own sink, whose push task
+        # would otherwise linger until the loop closes, one per session.
+        await task._sink.cleanup()
+        tracker.finish()
+        await patient_flow.get_calendar().release_holds(session.session_id)
+
+    bookings = _tool_results(context.messages, "record_user_visit_date")
+    return SessionResult(
+        session.session_id,
+        completed,
+        any(result.get("status") == "success" for result in bookings),
+        monotonic() - started,
+        flow_manager.current_node,
+    )
+
+
+class SlowBackend:
+    """Calendar backend that takes `latency` seconds per call, in its thread."""
+
+    def __init__(self, backend, latency: float) -> None:
+        self._backend = backend
+        self._latency = latency
+
+    def get_busy(self, start, end):
+        sleep(self._latency)
+        return self._backend.get_busy(start, end)
+
+    def add_event(self, start, end, summary, event_id=None):
+        sleep(self._latency)
+        self._backend.add_event(start, end, summary, event_id)
+
+    def add_events(self, events):
+        sleep(self._latency)
+        self._backend.add_events(events)
+
+
+def fake_calendar(latency: float = 0.05, workers: int = 4) -> AsyncCalendar:
+    return AsyncCalendar(
+        SlowBackend(SQLiteCalendarBackend(":memory:"), latency),
+        max_workers=workers,
+        holds=SlotHolds(":memory:"),
+    )
+
+
+class LoopMonitor:
+    """Measures how late the event loop wakes a task that sleeps `interval`."""
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.lag = Histogram()
+        self.max_lag = 0.0
+        self.peak_rss = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        ticks = 0
+        while True:
+            before = monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, monotonic() - before - self.interval)
+            self.lag.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            ticks += 1
+            if ticks % 10 == 0:
+                self.sample_memory()
+
+    def sample_memory(self) -> None:
+        usage = process_usage(os.getpid())
+        if usage:
+            self.peak_rss = max(self.peak_rss, usage[0])
+
+
+@dataclass
+class SimulationReport:
+    results: List[SessionResult]
+    seconds: float
+    concurrency: int
+    peak_live: int
+    baseline_rss: int
+    peak_rss: int
+    loop: LoopMonitor
+    recorder: LatencyRecorder
+    tokens: TokenReport
+
+    @property
+    def completed(self) -> int:
+        return sum(result.completed for result in self.results)
+
+    @property
+    def booked(self) -> int:
+        return sum(result.booked for result in self.results)
+
+    @property
+    def sessions_per_second(self) -> float:
+        return self.completed / self.seconds if self.seconds else 0.0
+
+    @property
+    def memory_per_session(self) -> float:
+        return max(0, self.peak_rss - self.baseline_rss) / max(1, self.peak_live)
+
+    def format(self) -> str:
+        lag = self.loop.lag
+        lines = [
+            f"sessions     {len(self.results)} run, {self.completed} completed,"
+            f" {self.booked} booked",
+            f"throughput   {self.sessions_per_second:.2f} sessions/s"
+            f" ({self.seconds:.1f} s, concurrency {self.concurrency})",
+            f"loop lag     p50 {lag.quantile(0.5) * 1e3:.1f} ms"
+            f"  p95 {lag.quantile(0.95) * 1e3:.1f} ms"
+            f"  max {self.loop.max_lag * 1e3:.1f} ms",
+            f"memory       {self.memory_per_session / 2**20:.2f} MiB per live session"
+            f" ({self.peak_live} live, peak RSS {self.peak_rss / 2**20:.0f} MiB)",
+            "",
+            f"{'stage':<34} {'node':<20} {'count':>6} {'p50 ms':>8} {'p95 ms':>8}",
+        ]
+        for stage, nodes in self.recorder.summary().items():
+            for node, stats in nodes.items():
+                if stats["count"]:
+                    lines.append(
+                        f"{stage:<34} {node:<20} {stats['count']:>6}"
+                        f" {stats['p50_ms']:>8} {stats['p95_ms']:>8}"
+                    )
+        lines += [
+            "",
+            f"{'prompt tokens':<34} {'node':<20} {'calls':>6} {'mean':>8} {'max':>8}"
+            f" {'uncompacted':>12} {'saved':>6}",
+        ]
+        for node, stats in self.tokens.summary().items():
+            lines.append(
+                f"{'':<34} {node:<20} {stats['calls']:>6} {stats['mean_prompt']:>8}"
+                f" {stats['max_prompt']:>8} {stats['mean_uncompacted']:>12}"
+                f" {stats['saved_pct']:>5}%"
+            )
+        return "\n".join(lines)
+
+
+async def simulate(
+    sessions: int,
+    concurrency: int,
+    timings: Timings = Timings(),
+    seed: int = 0,
+    timeout: float = 300,
+    compaction: bool = True,
+) -> SimulationReport:
+    """Run `sessions` scripted calls, at most `concurrency` at a time."""
+    patient_flow.set_calendar(fake_calendar(timings.calendar))
+    availability_cache.clear()
+    recorder = LatencyRecorder(capacity=sessions * 10)
+    tokens = TokenReport()
+    monitor = LoopMonitor()
+    monitor.sample_memory()
+    baseline_rss = monitor.peak_rss
+    limit = asyncio.Semaphore(concurrency)
+    live = peak_live = 0
+
+    async def one(persona: Persona) -> SessionResult:
+        nonlocal live, peak_live
+        async with limit:
+            live += 1
+            peak_live = max(peak_live, live)
+            try:
+                return await run_session(
+                    persona, timings, recorder, tokens, compaction, timeout
+                )
+            finally:
+                live -= 1
+
+    monitor.start()
+    started = monotonic()
+    try:
+        results = await asyncio.gather(*map(one, make_personas(sessions, seed)))
+    finally:
+        await monitor.stop()
+    monitor.sample_memory()
+    return SimulationReport(
+        list(results),
+        monotonic() - started,
+        concurrency,
+        peak_live,
+        baseline_rss,
+        monitor.peak_rss,
+        monitor,
+        recorder,
+        tokens,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--time-scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--no-compaction", action="store_true")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+    report = asyncio.run(
+        simulate(
+            args.sessions,
+            args.concurrency,
+            Timings().scaled(args.time_scale),
+            args.seed,
+            args.timeout,
+            not args.no_compaction,
+        )
+    )
+    print(report.format())
+
+
+if __name__ == "__main__":
+    main()
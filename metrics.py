@@ -0,0 +1,164 @@
+import os
+import threading
+from bisect import bisect_left
+from time import monotonic
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds; covers a fast cache hit up to a call that stalls on the calendar.
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    0.75,
+    1.0,
+    1.5,
+    2.0,
+    3.0,
+    5.0,
+    10.0,
+)
+
+
+class Histogram:
+    """Fixed-bucket histogram: O(log buckets) to observe, constant memory.
+
+    Counts are per bucket (upper bound inclusive) plus an overflow bucket;
+    quantiles are estimated by interpolating inside the matching bucket.
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else lower * 2
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """(upper bound, count <= bound) pairs, ending with (+inf, total)."""
+        total, pairs = 0, []
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            total += n
+            pairs.append((bound, total))
+        return pairs
+
+    def summary(self) -> Dict[str, float]:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum / self.count * 1000, 1),
+            "p50_ms": round(self.quantile(0.5) * 1000, 1),
+            "p95_ms": round(self.quantile(0.95) * 1000, 1),
+        }
+
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def render_metric(
+    name: str,
+    kind: str,
+    help: str,
+    samples: Iterable[Tuple[Dict[str, str], float]],
+) -> List[str]:
+    """Prometheus text-format lines for a gauge or counter family."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{_labels(labels)} {value}" for labels, value in samples]
+    return lines
+
+
+def render_histogram(
+    name: str, help: str, histograms: Dict[Tuple[Tuple[str, str], ...], Histogram]
+) -> List[str]:
+    """Prometheus lines for histograms keyed by their label pairs."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+    for key, histogram in histograms.items():
+        labels = dict(key)
+        for bound, count in histogram.cumulative():
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': le})} {count}")
+        lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+    return lines
+
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def process_usage(pid: int) -> Optional[Tuple[int, float]]:
+    """(RSS bytes, CPU seconds) of `pid` and its descendants, from /proc.
+
+    Children are included because bots started through a shell run as the
+    shell's child. None if the process is gone (or there is no /proc).
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Fields after the parenthesised command name; utime/stime are 14/15.
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            rss = int(f.read().split()[1]) * _PAGE_SIZE
+        try:
+            with open(f"/proc/{pid}/task/{pid}/children") as f:
+                children = [int(child) for child in f.read().split()]
+        except OSError:
+            children = []
+    except (OSError, IndexError, ValueError):
+        return None
+    cpu = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+    for child in children:
+        usage = process_usage(child)
+        if usage:
+            rss += usage[0]
+            cpu += usage[1]
+    return rss, cpu
+
+
+class ProcessSampler:
+    """Caches process_usage() for `interval` seconds so scrapes stay cheap."""
+
+    def __init__(self, interval: float = 5.0) -> None:
+        self.interval = interval
+        self._samples: Dict[int, Tuple[float, Optional[Tuple[int, float]]]] = {}
+
+    def sample(self, pids: Iterable[int]) -> Dict[int, Tuple[int, float]]:
+        now = monotonic()
+        samples = {}
+        for pid in pids:
+            cached = self._samples.get(pid)
+            if cached is None or now - cached[0] >= self.interval:
+                cached = (now, process_usage(pid))
+            samples[pid] = cached
+        self._samples = samples
+        return {pid: usage for pid, (_, usage) in samples.items() if usage}
@@ -0,0 +1,243 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+from time import time
+from typing import Callable, List, Optional
+
+from loguru import logger
+
+from async_cal import AsyncCalendar
+from cal import CalendarBackend, Interval, PendingEvent
+
+
+def booking_key(start: datetime, summary: str) -> str:
+    # Hex digits are valid Google Calendar event ids, so the key doubles as one.
+    return hashlib.sha1(f"{start.isoformat()}|{summary}".encode()).hexdigest()
+
+
+class BookingOutbox:
+    """Durable queue of bookings waiting to reach the calendar backend.
+
+    Rows are keyed by an idempotency key: enqueuing the same booking twice
+    keeps one row, and the key is passed on as the calendar event id so a
+    retried insert never creates a second event. Several worker processes
+    can share one file; claims are leased so they don't flush the same rows
+    at once.
+    """
+
+    def __init__(self, path: str = "outbox.db") -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS bookings (
+                key TEXT PRIMARY KEY,
+                start TEXT NOT NULL,
+                end TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                last_error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS bookings_due
+                ON bookings (status, next_attempt);
+            """)
+
+    def enqueue(self, start: datetime, end: datetime, summary: str) -> str:
+        key = booking_key(start, summary)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR IGNORE INTO bookings"
+                " (key, start, end, summary, next_attempt) VALUES (?, ?, ?, ?, ?)",
+                (key, start.isoformat(), end.isoformat(), summary, time()),
+            )
+        return key
+
+    def pending_busy(self, start: datetime, end: datetime) -> List[Interval]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT start, end FROM bookings"
+                " WHERE status = 'pending' AND start < ? AND end > ?",
+                (end.isoformat(), start.isoformat()),
+            ).fetchall()
+        return [
+            (datetime.fromisoformat(row[0]), datetime.fromisoformat(row[1]))
+            for row in rows
+        ]
+
+    def claim(self, limit: int, lease: float = 30.0) -> List[PendingEvent]:
+        now = time()
+        with self._lock, self._db:
+            # IMMEDIATE takes the write lock up front so two processes can't
+            # read the same due rows.
+            self._db.execute("BEGIN IMMEDIATE")
+            rows = self._db.execute(
+                "SELECT key, start, end, summary FROM bookings"
+                " WHERE status = 'pending' AND next_attempt <= ?"
+                " ORDER BY next_attempt LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE bookings SET next_attempt = ? WHERE key = ?",
+                [(now + lease, row[0]) for row in rows],
+            )
+        return [
+            (key, datetime.fromisoformat(start), datetime.fromisoformat(end), summary)
+            for key, start, end, summary in rows
+        ]
+
+    def mark_done(self, keys: List[str]) -> None:
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE bookings SET status = 'done', last_error = NULL WHERE key = ?",
+                [(key,) for key in keys],
+            )
+
+    def mark_failed(
+        self, keys: List[str], error: str, backoff: float, max_attempts: int
+    ) -> None:
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE bookings SET attempts = attempts + 1, last_error = ?,"
+                " next_attempt = ? + ? * (1 << MIN(attempts, 10)),"
+                " status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE status END"
+                " WHERE key = ?",
+                [(error, time(), backoff, max_attempts, key) for key in keys],
+            )
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT status, COUNT(*) FROM bookings GROUP BY status"
+            ).fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class OutboxBackend:
+    """CalendarBackend that books into the outbox and reads through to `backend`.
+
+    Pending bookings count as busy, so a slot confirmed to a caller is never
+    offered again while it waits to be flushed.
+    """
+
+    def __init__(
+        self,
+        backend: CalendarBackend,
+        outbox: BookingOutbox,
+        on_enqueue: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.backend = backend
+        self.outbox = outbox
+        self.on_enqueue = on_enqueue
+
+    def get_busy(self, start: datetime, end: datetime) -> List[Interval]:
+        # Outbox first: a row flushed in between is then already in the backend.
+        pending = self.outbox.pending_busy(start, end)
+        return self.backend.get_busy(start, end) + pending
+
+    def add_event(
+        self,
+        start: datetime,
+        end: datetime,
+        summary: str,
+        event_id: Optional[str] = None,
+    ) -> None:
+        self.outbox.enqueue(start, end, summary)
+        if self.on_enqueue:
+            self.on_enqueue()
+
+    def add_events(self, events: List[PendingEvent]) -> None:
+        for event_id, start, end, summary in events:
+            self.add_event(start, end, summary, event_id)
+
+
+class OutboxFlusher:
+    """Background task draining the outbox into the real backend in batches."""
+
+    def __init__(
+        self,
+        outbox: BookingOutbox,
+        calendar: AsyncCalendar,
+        batch_size: int = 20,
+        interval: float = 1.0,
+        backoff: float = 1.0,
+        max_attempts: int = 8,
+    ) -> None:
+        self.outbox = outbox
+        self.calendar = calendar
+        self.batch_size = batch_size
+        self.interval = interval
+        self.backoff = backoff
+        self.max_attempts = max_attempts
+        self.flushed = 0
+        self.failures = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Last chance to deliver what this session booked; anything left stays
+        # in the outbox for the next flusher.
+        await self.flush()
+
+    def notify(self) -> None:
+        """Wake the flusher now. Safe to call from any thread."""
+        if self._loop and self._wakeup and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def flush(self) -> int:
+        flushed = 0
+        while True:
+            batch = await asyncio.to_thread(self.outbox.claim, self.batch_size)
+            if not batch:
+                return flushed
+            keys = [event[0] for event in batch]
+            try:
+                await self.calendar.add_events(batch)
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"Flushing {len(batch)} bookings failed: {e}")
+                await asyncio.to_thread(
+                    self.outbox.mark_failed,
+                    keys,
+                    str(e),
+                    self.backoff,
+                    self.max_attempts,
+                )
+                return flushed
+            await asyncio.to_thread(self.outbox.mark_done, keys)
+            flushed += len(batch)
+            self.flushed += len(batch)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.exception(f"Outbox flush error: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
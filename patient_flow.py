@@ -5,11 +5,15 @@
 #
 
 import asyncio
+import copy
+import functools
+from dataclasses import dataclass, field
 from datetime import datetime
 import os
 import sys
+import uuid
 from pathlib import Path
-from typing import Any, Dict, Iterable, List
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
 
 import aiohttp
 from dotenv import load_dotenv
@@ -31,7 +35,12 @@ from pipecat.transports.services.daily import (
 from patient import Patient, summarize
 
 sys.path.append(str(Path(__file__).parent.parent))
-from cal import create_event, init_calendar, free_times
+from async_cal import AsyncCalendar
+from cal import availability_cache, init_calendar
+from compaction import ContextCompactor, token_report
+from holds import SlotHolds
+from latency import TurnTracker, latency_recorder
+from outbox import BookingOutbox, OutboxBackend, OutboxFlusher
 from runner import configure
 
 from pipecat_flows import FlowArgs, FlowConfig, FlowManager, FlowResult
@@ -42,10 +51,57 @@ logger.remove(0)
 logger.add(sys.stderr, level="DEBUG")
 
 
-cal = init_calendar(os.getenv("EMAIL_ID", ""))
+availability_cache.ttl = float(
+    os.getenv("AVAILABILITY_CACHE_TTL") or availability_cache.ttl
+)
+
+_calendar: Optional[AsyncCalendar] = None
+_outbox_flusher: Optional[OutboxFlusher] = None
+
+
+def get_calendar() -> AsyncCalendar:
+    """Calendar backend chosen by CALENDAR_BACKEND, created on first use.
+
+    Bookings go to the local outbox and are confirmed right away; the outbox
+    flusher delivers them to the backend in the background.
+    """
+    global _calendar, _outbox_flusher
+    if _calendar is None:
+        backend = init_calendar()
+        timeout = float(os.getenv("CALENDAR_TIMEOUT") or 10)
+        outbox = BookingOutbox(os.getenv("BOOKING_OUTBOX_DB") or "outbox.db")
+        _outbox_flusher = OutboxFlusher(
+            outbox, AsyncCalendar(backend, max_workers=1, timeout=timeout)
+        )
+        _calendar = AsyncCalendar(
+            OutboxBackend(backend, outbox, on_enqueue=_outbox_flusher.notify),
+            max_workers=int(os.getenv("CALENDAR_WORKERS") or 4),
+            timeout=timeout,
+            holds=SlotHolds(
+                os.getenv("SLOT_HOLDS_DB") or "holds.db",
+                ttl=float(os.getenv("SLOT_HOLD_TTL") or 120),
+            ),
+        )
+    return _calendar
 
 
-patient_details: Dict[str, Any] = {}
+def get_outbox_flusher() -> OutboxFlusher:
+    get_calendar()
+    return _outbox_flusher
+
+
+def set_calendar(calendar: AsyncCalendar) -> None:
+    """Serve every session from `calendar` (load tests use a local fake)."""
+    global _calendar
+    _calendar = calendar
+
+
+@dataclass
+class IntakeSession:
+    """State of one intake call. Every handler gets the session it serves."""
+
+    session_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    patient_details: Dict[str, Any] = field(default_factory=dict)
 
 
 class DepartmentsResult(FlowResult):
@@ -59,61 +115,66 @@ class AvailableDatesResult(FlowResult):
 departments = ["Cardiologie", "Kinésithérapie", "Dentiste"]
 
 
-async def get_departments() -> DepartmentsResult:
+async def get_departments(session: IntakeSession) -> DepartmentsResult:
     return {"departments": departments, "status": "success"}
 
 
-async def get_available_dates() -> AvailableDatesResult:
-    dates = free_times(cal)
+async def get_available_dates(session: IntakeSession) -> AvailableDatesResult:
+    dates = await get_calendar().free_times()
+    logger.debug(f"Availability cache: {availability_cache.stats()}")
     return {"status": "success", "dates": dates}
 
 
-async def record_personal_details(args: FlowArgs) -> FlowResult:
-    patient_details["name"] = args["name"]
-    patient_details["date_of_birth"] = args["date_of_birth"]
+async def record_personal_details(session: IntakeSession, args: FlowArgs) -> FlowResult:
+    session.patient_details["name"] = args["name"]
+    session.patient_details["date_of_birth"] = args["date_of_birth"]
     return {"status": "success"}
 
 
-async def record_user_visit_date(args: FlowArgs) -> FlowResult:
+async def record_user_visit_date(session: IntakeSession, args: FlowArgs) -> FlowResult:
     logger.debug("Inside the record_user_visit_date function")
     logger.debug(f"Got visit date: {args['visit_date']}")
-    patient_details["visit_date"] = args["visit_date"]
-    p: Patient = Patient(**patient_details)
+    session.patient_details["visit_date"] = args["visit_date"]
+    p: Patient = Patient(**session.patient_details)
     logger.debug("Converted patient data into class")
     formatted_date = datetime.strptime(p["visit_date"], "%Y-%m-%d")
     logger.debug("Formatted date")
     try:
-        create_event(cal, formatted_date, summarize(p))
+        slot = await get_calendar().book_visit(
+            formatted_date.date(), summarize(p), session.session_id
+        )
+        if slot is None:
+            return {"status": "failure", "error": "Aucun créneau libre à cette date"}
         return {"status": "success"}
     except Exception as e:
         logger.exception(f"Failed creating event: {e}")
         return {"status": "failure", "error": str(e)}
 
 
-async def record_prescriptions(args: FlowArgs) -> FlowResult:
+async def record_prescriptions(session: IntakeSession, args: FlowArgs) -> FlowResult:
     """Handler for recording prescriptions."""
-    patient_details["prescriptions"] = args["prescriptions"]
+    session.patient_details["prescriptions"] = args["prescriptions"]
     return {"status": "success"}
     # In a real app, this would store in patient records
 
 
-async def record_allergies(args: FlowArgs) -> FlowResult:
+async def record_allergies(session: IntakeSession, args: FlowArgs) -> FlowResult:
     """Handler for recording allergies."""
-    patient_details["allergies"] = args["allergies"]
+    session.patient_details["allergies"] = args["allergies"]
     return {"status": "success"}
     # In a real app, this would store in patient records
 
 
-async def record_conditions(args: FlowArgs) -> FlowResult:
+async def record_conditions(session: IntakeSession, args: FlowArgs) -> FlowResult:
     """Handler for recording medical conditions."""
-    patient_details["conditions"] = args["conditions"]
+    session.patient_details["conditions"] = args["conditions"]
     return {"status": "success"}
 
 
-async def record_visit_reasons(args: FlowArgs) -> FlowResult:
+async def record_visit_reasons(session: IntakeSession, args: FlowArgs) -> FlowResult:
     """Handler for recording visit reasons."""
     reasons_list = ", ".join([reason["name"] for reason in args["visit_reasons"]])
-    patient_details["visit_reasons"] = reasons_list
+    session.patient_details["visit_reasons"] = reasons_list
     return {"status": "success"}
 
 
@@ -408,80 +469,164 @@ flow_config: FlowConfig = {
 }
 
 
+def create_flow_config(
+    session: IntakeSession, tracker: Optional[TurnTracker] = None
+) -> FlowConfig:
+    """flow_config with every handler bound to `session` (and timed by `tracker`)."""
+    config = copy.deepcopy(flow_config)
+    for node in config["nodes"].values():
+        for function in node["functions"]:
+            handler = function["function"].get("handler")
+            if handler is not None:
+                bound = functools.partial(handler, session)
+                if tracker is not None:
+                    bound = tracker.timed(handler.__name__, bound)
+                function["function"]["handler"] = bound
+    return config
+
+
 async def handle_transition(function_name: str, args: Dict[str, Any], flow_manager):
     if function_name == "get_departments":
         if args["department"] not in departments:
             await flow_manager.set_node("end")
 
 
-async def main():
-    """Main function to set up and run the patient intake bot."""
-    async with aiohttp.ClientSession() as session:
-        (room_url, _) = await configure(session)
-
-        transport = DailyTransport(
-            room_url,
-            None,
-            "Jérome",
-            DailyParams(
-                audio_out_enabled=True,
-                vad_enabled=True,
-                vad_analyzer=SileroVADAnalyzer(),
-                vad_audio_passthrough=True,
-                transcription_enabled=True,
-                transcription_settings=DailyTranscriptionSettings(
-                    language="fr",
-                ),
+async def run_bot(
+    room_url: str,
+    token: Optional[str],
+    http_session: aiohttp.ClientSession,
+    session: Optional[IntakeSession] = None,
+    handle_sigint: bool = True,
+    on_joined: Optional[Callable[[], Awaitable[None]]] = None,
+):
+    """Run one intake call. Several can run concurrently in one worker.
+
+    `on_joined` is awaited once the bot is in the room (used by the worker
+    pool to report join latency).
+    """
+    session = session or IntakeSession()
+    logger.debug(f"Starting intake session {session.session_id} in {room_url}")
+
+    transport = DailyTransport(
+        room_url,
+        token,
+        "Jérome",
+        DailyParams(
+            audio_out_enabled=True,
+            vad_enabled=True,
+            vad_analyzer=SileroVADAnalyzer(),
+            vad_audio_passthrough=True,
+            transcription_enabled=True,
+            transcription_settings=DailyTranscriptionSettings(
+                language="fr",
             ),
-        )
+        ),
+    )
+
+    stt = DeepgramSTTService(
+        api_key=os.getenv("DEEPGRAM_API_KEY", ""),
+        live_options=LiveOptions(language=Language.FR),
+    )
+    tts = CartesiaTTSService(
+        params=CartesiaTTSService.InputParams(language=Language.FR),
+        api_key=os.getenv("CARTESIA_API_KEY", ""),
+        voice_id="0418348a-0ca2-4e90-9986-800fb8b3bbc0",  # French man
+    )
+    llm = OpenAILLMService(api_key=os.getenv("OPENAI_API_KEY"), model="gpt-4o")
+
+    context = OpenAILLMContext()
+    context_aggregator = llm.create_context_aggregator(context)
+
+    # Per-turn timings, grouped by the flow node the turn happened in
+    flow_manager = None
+    tracker = TurnTracker(
+        session.session_id,
+        node=lambda: flow_manager.current_node if flow_manager else None,
+    )
+
+    config = create_flow_config(session, tracker)
+    compactor = ContextCompactor(
+        config,
+        details=lambda: session.patient_details,
+        node=lambda: flow_manager.current_node if flow_manager else None,
+        enabled=os.getenv("CONTEXT_COMPACTION", "1") != "0",
+    )
+
+    pipeline = Pipeline(
+        [
+            transport.input(),  # Transport input
+            tracker.tap("vad_start", "vad_end"),
+            stt,
+            tracker.tap("transcript"),
+            context_aggregator.user(),  # User responses
+            compactor,  # Earlier nodes -> summary of collected details
+            llm,  # LLM
+            tracker.tap("llm_first_token", "function_call"),
+            tts,  # TTS
+            tracker.tap("tts_first_audio"),
+            transport.output(),  # Transport output
+            tracker.tap("audio_out"),
+            context_aggregator.assistant(),  # Assistant responses
+        ]
+    )
+
+    task = PipelineTask(pipeline, PipelineParams(allow_interruptions=True))
+
+    # Initialize flow manager with LLM
+    flow_manager = FlowManager(
+        task=task,
+        llm=llm,
+        tts=tts,
+        flow_config=config,
+        transition_callback=handle_transition,
+    )
+
+    if on_joined:
+
+        @transport.event_handler("on_joined")
+        async def on_transport_joined(transport, data):
+            await on_joined()
+
+    @transport.event_handler("on_first_participant_joined")
+    async def on_first_participant_joined(transport, participant):
+        await transport.capture_participant_transcription(participant["id"])
+        # Initialize the flow processor
+        await flow_manager.initialize()
+        # Kick off the conversation using the context aggregator
+        await task.queue_frames([context_aggregator.user().get_context_frame()])
 
-        stt = DeepgramSTTService(
-            api_key=os.getenv("DEEPGRAM_API_KEY", ""),
-            live_options=LiveOptions(language=Language.FR),
-        )
-        tts = CartesiaTTSService(
-            params=CartesiaTTSService.InputParams(language=Language.FR),
-            api_key=os.getenv("CARTESIA_API_KEY", ""),
-            voice_id="0418348a-0ca2-4e90-9986-800fb8b3bbc0",  # French man
-        )
-        llm = OpenAILLMService(api_key=os.getenv("OPENAI_API_KEY"), model="gpt-4o")
-
-        context = OpenAILLMContext()
-        context_aggregator = llm.create_context_aggregator(context)
-
-        pipeline = Pipeline(
-            [
-                transport.input(),  # Transport input
-                stt,
-                context_aggregator.user(),  # User responses
-                llm,  # LLM
-                tts,  # TTS
-                transport.output(),  # Transport output
-                context_aggregator.assistant(),  # Assistant responses
-            ]
-        )
+    try:
+        runner = PipelineRunner(handle_sigint=handle_sigint)
+        await runner.run(task)
+    finally:
+        tracker.finish()
+        latency_recorder.log_summary()
+        token_report.log_summary()
+        await get_calendar().release_holds(session.session_id)
 
-        task = PipelineTask(pipeline, PipelineParams(allow_interruptions=True))
 
-        # Initialize flow manager with LLM
-        flow_manager = FlowManager(
-            task=task,
-            llm=llm,
-            tts=tts,
-            flow_config=flow_config,
-            transition_callback=handle_transition,
-        )
+async def warm_up():
+    """Pay the per-process start-up costs before the first call arrives.
 
-        @transport.event_handler("on_first_participant_joined")
-        async def on_first_participant_joined(transport, participant):
-            await transport.capture_participant_transcription(participant["id"])
-            # Initialize the flow processor
-            await flow_manager.initialize()
-            # Kick off the conversation using the context aggregator
-            await task.queue_frames([context_aggregator.user().get_context_frame()])
+    Loads the Silero model (imports, ONNX session) and opens the calendar,
+    outbox and holds databases, then starts the outbox flusher.
+    """
+    SileroVADAnalyzer()
+    get_calendar()
+    get_outbox_flusher().start()
 
-        runner = PipelineRunner()
-        await runner.run(task)
+
+async def main():
+    """Main function to set up and run the patient intake bot."""
+    async with aiohttp.ClientSession() as session:
+        (room_url, token) = await configure(session)
+
+        flusher = get_outbox_flusher()
+        flusher.start()
+        try:
+            await run_bot(room_url, token, session)
+        finally:
+            await flusher.stop()
 
 
 if __name__ == "__main__":
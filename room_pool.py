@@ -0,0 +1,180 @@
+import asyncio
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from time import time
+from typing import Any, Deque, Dict, Optional
+
+from loguru import logger
+
+from pipecat.transports.services.helpers.daily_rest import (
+    DailyRoomObject,
+    DailyRoomParams,
+    DailyRoomProperties,
+)
+
+
+@dataclass
+class PooledRoom:
+    url: str
+    token: str
+    expires: float  # wall-clock time the room and its token stop working
+
+
+class FakeDailyRESTHelper:
+    """Offline stand-in for DailyRESTHelper: same calls, no network.
+
+    `latency` simulates the REST round trip so the pool's effect on the join
+    path can be measured without a Daily account.
+    """
+
+    def __init__(self, latency: float = 0.0, domain: str = "fake.daily.co") -> None:
+        self.latency = latency
+        self.domain = domain
+        self.rooms: Dict[str, DailyRoomObject] = {}
+        self.tokens: Dict[str, str] = {}
+        self.calls: Dict[str, int] = {"create_room": 0, "get_token": 0, "delete": 0}
+
+    def get_name_from_url(self, room_url: str) -> str:
+        return room_url.rstrip("/").rsplit("/", 1)[-1]
+
+    async def create_room(self, params: DailyRoomParams) -> DailyRoomObject:
+        self.calls["create_room"] += 1
+        await asyncio.sleep(self.latency)
+        name = params.name or uuid.uuid4().hex[:12]
+        room = DailyRoomObject(
+            id=uuid.uuid4().hex,
+            name=name,
+            api_created=True,
+            privacy=params.privacy,
+            url=f"https://{self.domain}/{name}",
+            created_at=str(time()),
+            config=params.properties,
+        )
+        self.rooms[name] = room
+        return room
+
+    async def get_token(
+        self, room_url: str, expiry_time: float = 60 * 60, owner: bool = True
+    ) -> str:
+        self.calls["get_token"] += 1
+        await asyncio.sleep(self.latency)
+        if self.get_name_from_url(room_url) not in self.rooms:
+            raise Exception(f"Failed to create meeting token: no room {room_url}")
+        token = uuid.uuid4().hex
+        self.tokens[token] = room_url
+        return token
+
+    async def delete_room_by_url(self, room_url: str) -> bool:
+        self.calls["delete"] += 1
+        await asyncio.sleep(self.latency)
+        self.rooms.pop(self.get_name_from_url(room_url), None)
+        return True
+
+
+class RoomPool:
+    """Daily rooms with owner tokens, created ahead of the calls that use them.
+
+    `acquire` pops a ready room instead of awaiting create_room + get_token
+    on the request path; a background task refills the pool to `size` and
+    drops rooms whose room or token would expire within `min_remaining`
+    seconds. If the pool is empty the room is provisioned on the spot.
+    """
+
+    def __init__(
+        self,
+        helper,
+        size: int = 4,
+        ttl: float = 60 * 60,
+        min_remaining: float = 10 * 60,
+        retry_delay: float = 5.0,
+    ) -> None:
+        self.helper = helper
+        self.size = size
+        self.ttl = ttl
+        self.min_remaining = min_remaining
+        self.retry_delay = retry_delay
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self._ready: Deque[PooledRoom] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._refill_loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        rooms, self._ready = list(self._ready), deque()
+        await asyncio.gather(
+            *(self.helper.delete_room_by_url(room.url) for room in rooms),
+            return_exceptions=True,
+        )
+
+    async def acquire(self) -> PooledRoom:
+        self._drop_expiring()
+        self._wakeup.set()
+        if self._ready:
+            self.hits += 1
+            return self._ready.popleft()
+        self.misses += 1
+        logger.warning("Room pool empty, creating a room on the request path")
+        return await self._provision()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": len(self._ready),
+            "hits": self.hits,
+            "misses": self.misses,
+            "failures": self.failures,
+        }
+
+    async def _provision(self) -> PooledRoom:
+        expires = time() + self.ttl
+        room = await self.helper.create_room(
+            DailyRoomParams(properties=DailyRoomProperties(exp=expires))
+        )
+        token = await self.helper.get_token(room.url, self.ttl)
+        return PooledRoom(url=room.url, token=token, expires=expires)
+
+    def _drop_expiring(self) -> None:
+        cutoff = time() + self.min_remaining
+        while self._ready and self._ready[0].expires <= cutoff:
+            # Rooms are created in order, so the oldest expire first.
+            room = self._ready.popleft()
+            asyncio.get_running_loop().create_task(
+                self.helper.delete_room_by_url(room.url)
+            )
+
+    async def _refill_loop(self) -> None:
+        while True:
+            self._wakeup.clear()
+            self._drop_expiring()
+            missing = self.size - len(self._ready)
+            if missing > 0:
+                results = await asyncio.gather(
+                    *(self._provision() for _ in range(missing)),
+                    return_exceptions=True,
+                )
+                failed = False
+                for result in results:
+                    if isinstance(result, PooledRoom):
+                        self._ready.append(result)
+                    else:
+                        failed = True
+                        self.failures += 1
+                        logger.error(f"Failed to provision a Daily room: {result}")
+                if failed:
+                    await asyncio.sleep(self.retry_delay)
+                    continue
+            # Wake up on acquire, or in time to replace the oldest room.
+            timeout = self.ttl - self.min_remaining
+            if self._ready:
+                timeout = self._ready[0].expires - self.min_remaining - time()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(timeout, 1.0))
+            except asyncio.TimeoutError:
+                pass
@@ -24,6 +24,13 @@ async def configure(aiohttp_session: aiohttp.ClientSession):
         required=False,
         help="Daily API Key (needed to create an owner token for the room)",
     )
+    parser.add_argument(
+        "-t",
+        "--token",
+        type=str,
+        required=False,
+        help="Owner token for the room (skips creating one with the API key)",
+    )
 
     args, unknown = parser.parse_known_args()
 
@@ -35,6 +42,10 @@ async def configure(aiohttp_session: aiohttp.ClientSession):
             "No Daily room specified. use the -u/--url option from the command line, or set DAILY_SAMPLE_ROOM_URL in your environment to specify a Daily room URL."
         )
 
+    # The server hands pre-provisioned rooms over with their token.
+    if args.token:
+        return (url, args.token)
+
     if not key:
         raise Exception(
             "No Daily API key specified. use the -k/--apikey option from the command line, or set DAILY_API_KEY in your environment to specify a Daily API key, available from https://dashboard.daily.co/developers."
@@ -5,31 +5,123 @@
 #
 
 import argparse
+import asyncio
 import os
+import socket
 import subprocess
+from collections import Counter, OrderedDict
 from contextlib import asynccontextmanager
+from time import monotonic
+from typing import Optional
 
 import aiohttp
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
 from dotenv import load_dotenv
+from loguru import logger
 
 from pipecat.transports.services.helpers.daily_rest import (
     DailyRESTHelper,
     DailyRoomParams,
 )
 
+from admission import SessionScheduler
+from bot_pool import BotWorkerPool, PoolExhausted
+from cluster import NodeRegistry
+from metrics import Histogram, ProcessSampler, render_histogram, render_metric
+from room_pool import FakeDailyRESTHelper, RoomPool
+
 MAX_BOTS_PER_ROOM = 1
 
-# Bot sub-process dict for status reporting and concurrency control
+# Bot sub-process dict for status reporting and concurrency control. Only
+# live processes stay here; reap_bots() moves finished ones to finished_bots,
+# which keeps the last FINISHED_BOTS_KEPT for status lookups.
 bot_procs = {}
+finished_bots = OrderedDict()
+FINISHED_BOTS_KEPT = 1000
+
+# Admission control for new calls
+scheduler = {}
 
 daily_helpers = {}
 
+# Warm bot workers (BOT_POOL_SIZE > 0); calls fall back to a fresh
+# sub-process when every worker is busy.
+bot_pool = {}
+
+# Daily rooms with tokens provisioned in the background (ROOM_POOL_SIZE > 0)
+room_pool = {}
+
+# SERVER_ROLE=node registers this server's capacity and sessions in the
+# shared registry; SERVER_ROLE=dispatcher runs no bots and places each call
+# on the least-loaded node.
+cluster = {}
+
+# Fleet metrics served at /metrics
+room_create_seconds = Histogram()
+token_fetch_seconds = Histogram()
+join_seconds = Histogram()
+session_seconds = Histogram(buckets=(30, 60, 120, 180, 300, 600, 900, 1800, 3600))
+session_started = {}
+bot_exits = Counter()
+process_sampler = ProcessSampler()
+
 load_dotenv()
 
 
+def cluster_bot_id(pid: int) -> str:
+    return f"{cluster['node_id']}-{pid}" if "registry" in cluster else str(pid)
+
+
+def bot_started(bot_id: str, room_url: str):
+    scheduler["sessions"].attach(room_url)
+    session_started[bot_id] = monotonic()
+    if "registry" in cluster:
+        cluster["registry"].record_session(bot_id, cluster["node_id"], room_url)
+
+
+def bot_finished(bot_id: str, room_url: str, exit_code):
+    sessions = scheduler["sessions"]
+    sessions.release(room_url)
+    bot_exits[str(exit_code)] += 1
+    started = session_started.pop(bot_id, None)
+    if started is not None:
+        session_seconds.observe(monotonic() - started)
+    if "registry" in cluster:
+        cluster["registry"].finish_session(bot_id)
+        # Free capacity is advertised right away, not at the next heartbeat
+        cluster["registry"].heartbeat(
+            cluster["node_id"], sessions.live, sessions.max_sessions
+        )
+
+
+def reap_bots():
+    for pid, (proc, room_url) in list(bot_procs.items()):
+        exit_code = proc.poll()
+        if exit_code is not None:
+            del bot_procs[pid]
+            finished_bots[pid] = room_url
+            if len(finished_bots) > FINISHED_BOTS_KEPT:
+                finished_bots.popitem(last=False)
+            bot_finished(cluster_bot_id(pid), room_url, exit_code)
+
+
+async def reap_bots_forever(interval: float = 1.0):
+    while True:
+        await asyncio.sleep(interval)
+        reap_bots()
+
+
+async def heartbeat_forever(interval: float):
+    registry, sessions = cluster["registry"], scheduler["sessions"]
+    while True:
+        await asyncio.to_thread(
+            registry.heartbeat, cluster["node_id"], sessions.live, sessions.max_sessions
+        )
+        await asyncio.sleep(interval)
+
+
 def cleanup():
     # Clean up function, just to be extra safe
     for entry in bot_procs.values():
@@ -41,12 +133,79 @@ def cleanup():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     aiohttp_session = aiohttp.ClientSession()
-    daily_helpers["rest"] = DailyRESTHelper(
-        daily_api_key=os.getenv("DAILY_API_KEY", ""),
-        daily_api_url=os.getenv("DAILY_API_URL", "https://api.daily.co/v1"),
-        aiohttp_session=aiohttp_session,
+    scheduler["sessions"] = SessionScheduler(
+        max_sessions=int(os.getenv("MAX_SESSIONS") or 8),
+        max_queue=int(os.getenv("MAX_QUEUED_CALLS") or 16),
+        max_load=float(os.getenv("MAX_LOAD_PER_CPU") or 0.85),
+        min_free_memory=float(os.getenv("MIN_FREE_MEMORY") or 0.1),
     )
+    reaper = asyncio.create_task(reap_bots_forever())
+    if os.getenv("DAILY_REST_FAKE"):
+        # Offline runs: rooms and tokens that only exist in memory
+        daily_helpers["rest"] = FakeDailyRESTHelper()
+    else:
+        daily_helpers["rest"] = DailyRESTHelper(
+            daily_api_key=os.getenv("DAILY_API_KEY", ""),
+            daily_api_url=os.getenv("DAILY_API_URL", "https://api.daily.co/v1"),
+            aiohttp_session=aiohttp_session,
+        )
+    rooms_size = int(os.getenv("ROOM_POOL_SIZE") or 0)
+    if rooms_size > 0:
+        room_pool["rooms"] = RoomPool(
+            daily_helpers["rest"],
+            size=rooms_size,
+            ttl=float(os.getenv("ROOM_POOL_TTL") or 60 * 60),
+        )
+        await room_pool["rooms"].start()
+    pool_size = int(os.getenv("BOT_POOL_SIZE") or 0)
+    if pool_size > 0:
+        bot_pool["pool"] = BotWorkerPool(
+            pool_size,
+            bot=os.getenv("BOT_POOL_BOT") or "patient_flow:run_bot",
+            warmup=os.getenv("BOT_POOL_WARMUP", "patient_flow:warm_up") or None,
+            max_calls=int(os.getenv("BOT_POOL_MAX_CALLS") or 20),
+            sessions_per_worker=int(os.getenv("BOT_POOL_SESSIONS_PER_WORKER") or 1),
+            on_joined=lambda session: join_seconds.observe(
+                session.joined_at - session.requested_at
+            ),
+            on_finished=lambda session: bot_finished(
+                session.session_id,
+                session.room_url,
+                0 if not session.error else "error",
+            ),
+        )
+        await bot_pool["pool"].start()
+    heartbeat = None
+    role = os.getenv("SERVER_ROLE", "standalone")
+    if role in ("node", "dispatcher"):
+        cluster["role"] = role
+        cluster["http"] = aiohttp_session
+        cluster["registry"] = NodeRegistry(
+            os.getenv("CLUSTER_DB") or "cluster.db",
+            node_ttl=float(os.getenv("NODE_TTL") or 10),
+        )
+    if role == "node":
+        port = os.getenv("FAST_API_PORT", "7860")
+        cluster["node_id"] = os.getenv("NODE_ID") or f"{socket.gethostname()}-{port}"
+        cluster["registry"].register(
+            cluster["node_id"],
+            os.getenv("NODE_URL") or f"http://localhost:{port}",
+            scheduler["sessions"].max_sessions,
+        )
+        heartbeat = asyncio.create_task(
+            heartbeat_forever(float(os.getenv("NODE_HEARTBEAT") or 2))
+        )
     yield
+    if heartbeat:
+        heartbeat.cancel()
+        cluster["registry"].deregister(cluster["node_id"])
+    if "registry" in cluster:
+        cluster.clear()
+    if "pool" in bot_pool:
+        await bot_pool.pop("pool").stop()
+    if "rooms" in room_pool:
+        await room_pool.pop("rooms").stop()
+    reaper.cancel()
     await aiohttp_session.close()
     cleanup()
 
@@ -63,62 +222,187 @@ app.add_middleware(
 
 
 @app.get("/")
-async def start_agent(request: Request):
-    print(f"!!! Creating room")
-    room = await daily_helpers["rest"].create_room(DailyRoomParams())
-    print(f"!!! Room URL: {room.url}")
+async def start_agent(request: Request, ticket: Optional[str] = None):
+    requested_at = monotonic()
+    if cluster.get("role") == "dispatcher":
+        return await dispatch(ticket)
+
+    # Admit, queue or shed before spending anything on the call
+    admission = scheduler["sessions"].request(ticket)
+    if not admission.admitted:
+        headers = {"Retry-After": str(admission.retry_after)}
+        if admission.ticket:
+            return JSONResponse(
+                {
+                    "status": "queued",
+                    "ticket": admission.ticket,
+                    "position": admission.position,
+                },
+                status_code=202,
+                headers=headers,
+            )
+        logger.warning(f"Shedding call: {admission.reason}")
+        raise HTTPException(
+            status_code=503,
+            detail=f"At capacity ({admission.reason}), retry later",
+            headers=headers,
+        )
+
+    try:
+        return await start_bot(requested_at)
+    except BaseException:
+        scheduler["sessions"].release()
+        raise
+
+
+async def start_bot(requested_at: float):
+    if "rooms" in room_pool:
+        # Room and owner token were created ahead of time
+        room = await room_pool["rooms"].acquire()
+        room_url, token = room.url, room.token
+    else:
+        print(f"!!! Creating room")
+        started = monotonic()
+        room = await daily_helpers["rest"].create_room(DailyRoomParams())
+        room_create_seconds.observe(monotonic() - started)
+        room_url, token = room.url, None
+    print(f"!!! Room URL: {room_url}")
     # Ensure the room property is present
-    if not room.url:
+    if not room_url:
         raise HTTPException(
             status_code=500,
             detail="Missing 'room' property in request data. Cannot start agent without a target room!",
         )
 
-    # Check if there is already an existing process running in this room
-    num_bots_in_room = sum(
-        1
-        for proc in bot_procs.values()
-        if proc[1] == room.url and proc[0].poll() is None
-    )
-    if num_bots_in_room >= MAX_BOTS_PER_ROOM:
+    # Check if there is already an existing bot running in this room
+    if scheduler["sessions"].in_room(room_url) >= MAX_BOTS_PER_ROOM:
         raise HTTPException(
-            status_code=500, detail=f"Max bot limited reach for room: {room.url}"
+            status_code=500, detail=f"Max bot limited reach for room: {room_url}"
         )
 
     # Get the token for the room
-    token = await daily_helpers["rest"].get_token(room.url)
+    if not token:
+        started = monotonic()
+        token = await daily_helpers["rest"].get_token(room_url)
+        token_fetch_seconds.observe(monotonic() - started)
 
     if not token:
         raise HTTPException(
-            status_code=500, detail=f"Failed to get token for room: {room.url}"
+            status_code=500, detail=f"Failed to get token for room: {room_url}"
         )
 
+    # Hand the call to a warm worker if one is free
+    if "pool" in bot_pool:
+        try:
+            session = bot_pool["pool"].assign(room_url, token, requested_at)
+            bot_started(session.session_id, room_url)
+            logger.info(
+                f"Bot {session.session_id} assigned to worker {session.worker_pid}"
+            )
+            return RedirectResponse(room_url, headers={"X-Bot-Id": session.session_id})
+        except PoolExhausted:
+            logger.warning("Bot pool exhausted, starting a new bot process")
+
     # Spawn a new agent, and join the user session
     # Note: this is mostly for demonstration purposes (refer to 'deployment' in README)
     try:
         proc = subprocess.Popen(
-            [f"python3 -m patient_flow -u {room.url} -t {token}"],
+            [f"python3 -m patient_flow -u {room_url} -t {token}"],
             shell=True,
             bufsize=1,
             cwd=os.path.dirname(os.path.abspath(__file__)),
         )
-        bot_procs[proc.pid] = (proc, room.url)
+        bot_procs[proc.pid] = (proc, room_url)
+        bot_started(cluster_bot_id(proc.pid), room_url)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to start subprocess: {e}")
 
-    return RedirectResponse(room.url)
+    return RedirectResponse(room_url, headers={"X-Bot-Id": cluster_bot_id(proc.pid)})
+
+
+async def dispatch(ticket: Optional[str]):
+    """Start the call on the least-loaded node, trying the next if it's full."""
+    registry = cluster["registry"]
+    if ticket and "." in ticket:
+        # Queued earlier: only the node that issued the ticket knows it
+        node_id, ticket = ticket.split(".", 1)
+        node = await asyncio.to_thread(registry.get_node, node_id)
+        if node:
+            response = await forward(node, ticket)
+            if response is not None:
+                return response
+
+    tried = ()
+    while node := await asyncio.to_thread(registry.place, tried):
+        response = await forward(node, None)
+        if response is not None and response.status_code != 202:
+            return response
+        # The node turned the call down; its next heartbeat would fix the
+        # count anyway, but give the reservation back for the next caller.
+        await asyncio.to_thread(registry.unplace, node.node_id)
+        if response is not None:
+            return response
+        tried += (node.node_id,)
+
+    raise HTTPException(
+        status_code=503,
+        detail="No node has capacity, retry later",
+        headers={"Retry-After": "30"},
+    )
+
+
+async def forward(node, ticket: Optional[str]):
+    """Ask `node` to start a call. None if it is down or shedding."""
+    params = {"ticket": ticket} if ticket else {}
+    try:
+        async with cluster["http"].get(
+            f"{node.url}/",
+            params=params,
+            allow_redirects=False,
+            timeout=aiohttp.ClientTimeout(total=30),
+        ) as r:
+            if r.status in (301, 302, 303, 307, 308):
+                return RedirectResponse(
+                    r.headers["Location"],
+                    headers={"X-Bot-Id": r.headers.get("X-Bot-Id", "")},
+                )
+            if r.status == 202:
+                data = await r.json()
+                data["ticket"] = f"{node.node_id}.{data['ticket']}"
+                return JSONResponse(
+                    data,
+                    status_code=202,
+                    headers={"Retry-After": r.headers.get("Retry-After", "2")},
+                )
+            logger.warning(f"Node {node.node_id} refused a call ({r.status})")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(f"Node {node.node_id} unreachable: {e}")
+    return None
+
 
+@app.get("/status/{bot_id}")
+def get_status(bot_id: str):
+    # Pool sessions are identified by their session id
+    session = bot_pool["pool"].get(bot_id) if "pool" in bot_pool else None
+    if session:
+        return JSONResponse({"bot_id": bot_id, "status": session.status})
 
-@app.get("/status/{pid}")
-def get_status(pid: int):
     # Look up the subprocess
+    pid = int(bot_id) if bot_id.isdigit() else -1
     proc = bot_procs.get(pid)
+    if not proc and pid in finished_bots:
+        return JSONResponse({"bot_id": pid, "status": "finished"})
+
+    # Sessions started by any node of the cluster
+    if not proc and "registry" in cluster:
+        located = cluster["registry"].locate(bot_id)
+        if located:
+            node_id, status = located
+            return JSONResponse({"bot_id": bot_id, "status": status, "node": node_id})
 
     # If the subprocess doesn't exist, return an error
     if not proc:
-        raise HTTPException(
-            status_code=404, detail=f"Bot with process id: {pid} not found"
-        )
+        raise HTTPException(status_code=404, detail=f"Bot with id: {bot_id} not found")
 
     # Check the status of the subprocess
     if proc[0].poll() is None:
@@ -129,6 +413,126 @@ def get_status(pid: int):
     return JSONResponse({"bot_id": pid, "status": status})
 
 
+@app.get("/pool")
+def get_pool():
+    if "pool" not in bot_pool and "rooms" not in room_pool:
+        raise HTTPException(status_code=404, detail="Bot and room pools are disabled")
+    stats = {}
+    if "pool" in bot_pool:
+        stats["bots"] = bot_pool["pool"].stats()
+    if "rooms" in room_pool:
+        stats["rooms"] = room_pool["rooms"].stats()
+    return JSONResponse(stats)
+
+
+@app.get("/cluster")
+def get_cluster():
+    if "registry" not in cluster:
+        raise HTTPException(status_code=404, detail="Not part of a cluster")
+    nodes = cluster["registry"].nodes()
+    return JSONResponse(
+        {
+            "capacity": sum(node.capacity for node in nodes),
+            "live": sum(node.live for node in nodes),
+            "nodes": [
+                {
+                    "node_id": n.node_id,
+                    "url": n.url,
+                    "capacity": n.capacity,
+                    "live": n.live,
+                }
+                for n in nodes
+            ],
+        }
+    )
+
+
+@app.get("/metrics")
+def get_metrics():
+    sessions = scheduler["sessions"]
+    stats = sessions.stats()
+    lines = render_metric(
+        "bot_sessions",
+        "gauge",
+        "Bot sessions by state.",
+        [
+            ({"state": "active"}, stats["live"]),
+            ({"state": "queued"}, stats["queued"]),
+        ],
+    )
+    lines += render_metric(
+        "bot_sessions_admitted_total",
+        "counter",
+        "Calls admitted.",
+        [({}, stats["admitted"])],
+    )
+    lines += render_metric(
+        "bot_sessions_shed_total",
+        "counter",
+        "Calls turned away at capacity.",
+        [({}, stats["shed"])],
+    )
+    lines += render_metric(
+        "bot_sessions_finished_total",
+        "counter",
+        "Finished sessions by exit code.",
+        [({"code": code}, count) for code, count in sorted(bot_exits.items())],
+    )
+    lines += render_histogram(
+        "daily_room_create_seconds",
+        "Time to create a room on the request path.",
+        {(): room_create_seconds},
+    )
+    lines += render_histogram(
+        "daily_token_fetch_seconds",
+        "Time to fetch a meeting token on the request path.",
+        {(): token_fetch_seconds},
+    )
+    lines += render_histogram(
+        "bot_join_seconds",
+        "From the HTTP request to the bot joining the room.",
+        {(): join_seconds},
+    )
+    lines += render_histogram(
+        "bot_session_seconds",
+        "Duration of finished sessions.",
+        {(): session_seconds},
+    )
+
+    # RSS and CPU of the processes running sessions; a pool worker's numbers
+    # are shared by the sessions it hosts.
+    pids = {cluster_bot_id(pid): pid for pid in bot_procs}
+    if "pool" in bot_pool:
+        for session in bot_pool["pool"].sessions.values():
+            pids[session.session_id] = session.worker_pid
+    usage = process_sampler.sample(set(pids.values()))
+    samples = [
+        ({"bot_id": bot_id, "pid": pid}, usage[pid])
+        for bot_id, pid in sorted(pids.items())
+        if pid in usage
+    ]
+    lines += render_metric(
+        "bot_process_resident_bytes",
+        "gauge",
+        "Resident memory of bot processes.",
+        [(labels, rss) for labels, (rss, _) in samples],
+    )
+    lines += render_metric(
+        "bot_process_cpu_seconds_total",
+        "counter",
+        "CPU time of bot processes.",
+        [(labels, cpu) for labels, (_, cpu) in samples],
+    )
+    return PlainTextResponse(
+        "\n".join(lines) + "\n", media_type="text/plain; version=0.0.4"
+    )
+
+
+@app.get("/admission")
+def get_admission():
+    return JSONResponse(scheduler["sessions"].stats())
+
+
 if __name__ == "__main__":
     import uvicorn
 
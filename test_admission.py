@@ -0,0 +1,140 @@
+import subprocess
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from admission import SessionScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def scheduler(headroom=lambda: (0.1, 0.9), **kwargs):
+    clock = Clock()
+    return SessionScheduler(headroom=headroom, clock=clock, **kwargs), clock
+
+
+def test_admits_queues_then_sheds():
+    sessions, _ = scheduler(max_sessions=2, max_queue=2)
+    assert sessions.request().admitted
+    assert sessions.request().admitted
+
+    first, second = sessions.request(), sessions.request()
+    assert (first.position, second.position) == (1, 2)
+    assert first.ticket and first.retry_after == sessions.poll_after
+
+    shed = sessions.request()
+    assert not shed.admitted and shed.ticket is None
+    assert shed.retry_after == sessions.shed_retry_after
+    assert sessions.stats()["shed"] == 1
+
+
+def test_freed_slot_goes_to_the_head_of_the_queue():
+    sessions, _ = scheduler(max_sessions=1)
+    sessions.request()
+    first, second = sessions.request(), sessions.request()
+    sessions.release()
+
+    assert not sessions.request().admitted  # newcomer waits its turn
+    assert not sessions.request(second.ticket).admitted
+    assert sessions.request(first.ticket).admitted
+    assert sessions.request(second.ticket).position == 1
+
+
+def test_abandoned_tickets_are_dropped():
+    sessions, clock = scheduler(max_sessions=1, ticket_ttl=10)
+    sessions.request()
+    abandoned, waiting = sessions.request(), sessions.request()
+    clock.now = 8
+    sessions.request(waiting.ticket)
+    clock.now = 12
+    sessions.release()
+
+    assert sessions.request(waiting.ticket).admitted
+    assert sessions.stats()["queued"] == 0
+    assert sessions.request(abandoned.ticket).ticket != abandoned.ticket
+
+
+def test_host_headroom_is_sampled_at_most_once_per_interval():
+    samples = []
+
+    def headroom():
+        samples.append(1)
+        return (0.95, 0.5) if len(samples) == 1 else (0.2, 0.5)
+
+    sessions, clock = scheduler(headroom=headroom, sample_interval=1.0)
+    queued = sessions.request()
+    assert queued.reason == "cpu"
+    assert not sessions.request(queued.ticket).admitted
+    assert len(samples) == 1
+
+    clock.now = 1.5
+    assert sessions.request(queued.ticket).admitted
+    assert len(samples) == 2
+
+
+def test_state_stays_bounded_across_many_sessions():
+    sessions, clock = scheduler(max_sessions=4, ticket_ttl=1)
+    for i in range(20_000):
+        clock.now = i
+        if sessions.request().admitted:
+            sessions.attach(f"https://fake.daily.co/{i}")
+            sessions.release(f"https://fake.daily.co/{i}")
+    assert sessions.live == 0
+    assert not sessions.rooms and not sessions._waiting
+    assert sessions.admitted == 20_000
+
+
+class FinishedProcess:
+    pid = 4242
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def poll(self):
+        return 0
+
+    def terminate(self):
+        pass
+
+    def wait(self):
+        return 0
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("DAILY_REST_FAKE", "1")
+    monkeypatch.setenv("MAX_SESSIONS", "1")
+    monkeypatch.setenv("MAX_QUEUED_CALLS", "1")
+    monkeypatch.setenv("MAX_LOAD_PER_CPU", "1000")
+    monkeypatch.setenv("MIN_FREE_MEMORY", "0")
+    monkeypatch.setattr(subprocess, "Popen", FinishedProcess)
+    with TestClient(server.app) as client:
+        yield client
+    server.bot_procs.clear()
+    server.finished_bots.clear()
+
+
+def test_server_queues_sheds_and_reaps(client):
+    assert client.get("/", follow_redirects=False).status_code == 307
+
+    queued = client.get("/")
+    assert queued.status_code == 202
+    assert queued.headers["Retry-After"] == "2"
+    assert queued.json()["position"] == 1
+
+    shed = client.get("/")
+    assert shed.status_code == 503
+    assert shed.headers["Retry-After"] == "30"
+
+    server.reap_bots()
+    assert server.bot_procs == {}
+    assert client.get(f"/status/{FinishedProcess.pid}").json()["status"] == "finished"
+    ticket = queued.json()["ticket"]
+    assert client.get(f"/?ticket={ticket}", follow_redirects=False).status_code == 307
@@ -0,0 +1,97 @@
+import asyncio
+import time
+from datetime import date, timedelta
+
+import pytest
+
+from async_cal import AsyncCalendar
+from cal import availability_cache
+
+FRAME_INTERVAL = 0.01
+
+
+class SlowCalendar:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.events = []
+
+    def get_busy(self, start, end):
+        time.sleep(self.delay)
+        return list(self.events)
+
+    def add_event(self, start, end, summary):
+        time.sleep(self.delay)
+        self.events.append((start, end))
+
+
+@pytest.fixture(autouse=True)
+def reset_cache():
+    availability_cache.clear()
+    yield
+    availability_cache.clear()
+
+
+async def frame_lags(stop: asyncio.Event):
+    """Stand-in for the audio path: records how late each 10ms frame runs."""
+    lags = []
+    while not stop.is_set():
+        expected = time.perf_counter() + FRAME_INTERVAL
+        await asyncio.sleep(FRAME_INTERVAL)
+        lags.append(time.perf_counter() - expected)
+    return lags
+
+
+async def measure(call):
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(frame_lags(stop))
+    await asyncio.sleep(0.05)
+    result = await call()
+    stop.set()
+    return result, await ticker
+
+
+@pytest.mark.asyncio
+async def test_frames_keep_flowing_during_slow_calendar_io():
+    calendar = AsyncCalendar(SlowCalendar(delay=0.3))
+
+    dates, lags = await measure(calendar.free_times)
+
+    assert isinstance(dates, list)
+    assert len(lags) >= 20
+    assert max(lags) < 0.1
+    calendar.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_blocking_calendar_stalls_frames():
+    # Baseline the adapter exists for: the same call made inline freezes the loop.
+    slow = SlowCalendar(delay=0.3)
+
+    async def inline():
+        return slow.get_busy(None, None)
+
+    _, lags = await measure(inline)
+    assert max(lags) >= 0.25
+
+
+@pytest.mark.asyncio
+async def test_calendar_call_times_out():
+    calendar = AsyncCalendar(SlowCalendar(delay=0.3), timeout=0.05)
+    with pytest.raises(asyncio.TimeoutError):
+        await calendar.free_times()
+    calendar.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_interrupted_call_is_cancelled():
+    calendar = AsyncCalendar(SlowCalendar(delay=0.3), max_workers=1)
+    day = date.today() + timedelta(days=1)
+    first = asyncio.create_task(calendar.free_times())
+    queued = asyncio.create_task(calendar.next_free_slot(day))
+    await asyncio.sleep(0.01)
+
+    queued.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await queued
+    assert isinstance(await first, list)
+    calendar.shutdown()
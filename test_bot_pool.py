@@ -0,0 +1,75 @@
+import asyncio
+import os
+import signal
+from time import monotonic
+
+import pytest
+
+from bot_pool import BotWorkerPool, PoolExhausted
+
+BOT = "test_bot_pool:fake_run_bot"
+
+
+async def fake_run_bot(room_url, token, http_session, on_joined=None, **kwargs):
+    """Stands in for patient_flow.run_bot: joins at once, hangs up after a beat."""
+    await on_joined()
+    await asyncio.sleep(0.05)
+
+
+async def wait_for(condition, timeout=20.0):
+    deadline = monotonic() + timeout
+    while not condition():
+        assert monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+
+@pytest.mark.asyncio
+async def test_assigned_call_joins_and_finishes():
+    pool = BotWorkerPool(1, bot=BOT, warmup=None)
+    await pool.start()
+    try:
+        with pytest.raises(PoolExhausted):
+            pool.assign("https://example.daily.co/room", "token")
+        await wait_for(lambda: pool.idle_workers() == 1)
+
+        session = pool.assign("https://example.daily.co/room", "token")
+        await wait_for(lambda: session.status == "finished")
+        assert session.error is None
+        assert session.joined_at is not None
+        assert pool.stats()["joins"] == 1
+    finally:
+        await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_worker_is_recycled_after_max_calls():
+    pool = BotWorkerPool(1, bot=BOT, warmup=None, max_calls=2)
+    await pool.start()
+    try:
+        await wait_for(lambda: pool.idle_workers() == 1)
+        pids = []
+        for _ in range(3):
+            await wait_for(lambda: pool.idle_workers() == 1)
+            session = pool.assign("https://example.daily.co/room", None)
+            pids.append(session.worker_pid)
+            await wait_for(lambda: session.status == "finished")
+
+        assert pids[0] == pids[1] != pids[2]
+        assert pool.restarts == 0
+    finally:
+        await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_dead_worker_is_replaced():
+    pool = BotWorkerPool(1, bot=BOT, warmup=None)
+    await pool.start()
+    try:
+        await wait_for(lambda: pool.idle_workers() == 1)
+        pid = pool._workers[0].pid
+        os.kill(pid, signal.SIGKILL)
+
+        await wait_for(lambda: pool.restarts == 1 and pool.idle_workers() == 1)
+        assert pool._workers[0].pid != pid
+    finally:
+        await pool.stop()
@@ -0,0 +1,205 @@
+import threading
+from time import monotonic, sleep
+from datetime import date, datetime, time, timedelta
+
+import pytest
+from gcsa.event import Event
+
+from cal import (
+    AvailabilityCache,
+    AvailabilityIndex,
+    SQLiteCalendarBackend,
+    availability_cache,
+    cached_free_times,
+    create_event,
+    init_calendar,
+    next_free_slot,
+)
+
+
+class CountingCalendar(SQLiteCalendarBackend):
+    def __init__(self):
+        super().__init__()
+        self.get_calls = 0
+
+    def get_busy(self, start, end):
+        self.get_calls += 1
+        return super().get_busy(start, end)
+
+
+@pytest.fixture(autouse=True)
+def reset_cache():
+    availability_cache.clear()
+    yield
+    availability_cache.clear()
+
+
+def test_cache_hits_after_first_load():
+    cache = AvailabilityCache(ttl=60)
+    calls = []
+    loader = lambda: calls.append(1) or ["2024-12-22"]
+
+    assert cache.get("cal", loader) == ["2024-12-22"]
+    assert cache.get("cal", loader) == ["2024-12-22"]
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_expires_after_ttl():
+    cache = AvailabilityCache(ttl=0.01)
+    calls = []
+    loader = lambda: calls.append(1) or []
+
+    cache.get("cal", loader)
+    sleep(0.02)
+    cache.get("cal", loader)
+    assert len(calls) == 2
+    assert cache.stats()["misses"] == 2
+
+
+def test_cache_refreshes_in_background_before_expiry():
+    cache = AvailabilityCache(ttl=60, refresh_ahead=0)
+    release = threading.Event()
+    values = iter([["old"], ["new"]])
+
+    def loader():
+        value = next(values)
+        if value == ["new"]:
+            release.wait(1)
+        return value
+
+    assert cache.get("cal", loader) == ["old"]
+    # The refresh is blocked, yet the stale-but-valid entry is served at once.
+    assert cache.get("cal", loader) == ["old"]
+    release.set()
+    deadline = monotonic() + 1
+    while cache.get("cal", loader) != ["new"] and monotonic() < deadline:
+        sleep(0.001)
+    assert cache.get("cal", loader) == ["new"]
+    assert cache.stats()["refreshes"] >= 1
+
+
+def test_concurrent_misses_share_one_load():
+    cache = AvailabilityCache(ttl=60)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        sleep(0.05)
+        return ["2024-12-22"]
+
+    threads = [
+        threading.Thread(target=cache.get, args=("cal", loader)) for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+
+
+def test_create_event_invalidates_cached_availability():
+    cal = CountingCalendar()
+    day = date.today() + timedelta(days=2)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+
+    before = cached_free_times(cal)
+    assert cached_free_times(cal) == before
+    assert cal.get_calls == 1
+
+    slot = next_free_slot(cal, day)
+    assert slot == datetime.combine(day, time(9))
+    create_event(cal, slot, "visit")
+    assert next_free_slot(cal, day) == datetime.combine(day, time(9, 30))
+    assert cal.get_calls == 2
+
+
+# Monday 2024-12-16 to Sunday 2024-12-22
+MONDAY = datetime(2024, 12, 16)
+
+
+def test_index_merges_overlapping_busy_intervals():
+    index = AvailabilityIndex(
+        [
+            (MONDAY.replace(hour=10), MONDAY.replace(hour=11)),
+            (MONDAY.replace(hour=10, minute=30), MONDAY.replace(hour=12)),
+            (MONDAY.replace(hour=14), MONDAY.replace(hour=15)),
+        ]
+    )
+    assert len(index) == 2
+    assert not index.is_free(
+        MONDAY.replace(hour=11), MONDAY.replace(hour=11, minute=30)
+    )
+    assert index.is_free(MONDAY.replace(hour=12), MONDAY.replace(hour=14))
+
+
+def test_single_event_does_not_block_the_whole_day():
+    index = AvailabilityIndex([(MONDAY.replace(hour=9), MONDAY.replace(hour=10))])
+    end = MONDAY + timedelta(days=2)
+    assert index.free_dates(MONDAY, end) == ["2024-12-16", "2024-12-17"]
+    assert index.first_free_slot(MONDAY, end) == MONDAY.replace(hour=10)
+
+
+def test_free_slots_skip_busy_time_and_stay_on_grid():
+    index = AvailabilityIndex(
+        [(MONDAY.replace(hour=9, minute=10), MONDAY.replace(hour=9, minute=40))],
+        opening_hours={0: (time(9), time(11))},
+    )
+    slots = index.free_slots(MONDAY, MONDAY.replace(hour=11), timedelta(minutes=30))
+    assert slots[0] == MONDAY.replace(hour=9, minute=45)
+    assert slots[-1] == MONDAY.replace(hour=10, minute=30)
+    assert all(slot.minute % 15 == 0 for slot in slots)
+
+
+def test_window_start_is_rounded_up_to_the_grid():
+    index = AvailabilityIndex([])
+    start = MONDAY.replace(hour=9, minute=7)
+    assert index.first_free_slot(start, MONDAY.replace(hour=18)) == MONDAY.replace(
+        hour=9, minute=15
+    )
+
+
+def test_all_day_event_and_weekend_are_unavailable():
+    index = AvailabilityIndex.from_events([Event("congés", start=date(2024, 12, 17))])
+    dates = index.free_dates(MONDAY, MONDAY + timedelta(days=6))
+    assert dates == ["2024-12-16", "2024-12-18", "2024-12-19", "2024-12-20"]
+
+
+def test_department_opening_hours():
+    index = AvailabilityIndex(
+        [],
+        department_hours={"Kinésithérapie": {5: (time(8), time(12))}},
+    )
+    saturday = MONDAY + timedelta(days=5)
+    assert index.free_dates(saturday, saturday + timedelta(days=1)) == []
+    assert index.free_dates(
+        saturday, saturday + timedelta(days=1), department="Kinésithérapie"
+    ) == ["2024-12-21"]
+    assert index.first_free_slot(
+        saturday, saturday + timedelta(days=1), department="Kinésithérapie"
+    ) == saturday.replace(hour=8)
+
+
+def test_sqlite_backend_returns_overlapping_busy_intervals():
+    backend = SQLiteCalendarBackend()
+    backend.add_event(MONDAY.replace(hour=9), MONDAY.replace(hour=10), "a")
+    backend.add_event(MONDAY.replace(hour=11), MONDAY.replace(hour=12), "b")
+    backend.add_event(MONDAY.replace(hour=17), MONDAY.replace(hour=18), "c")
+
+    busy = backend.get_busy(MONDAY.replace(hour=9, minute=30), MONDAY.replace(hour=17))
+    assert busy == [
+        (MONDAY.replace(hour=9), MONDAY.replace(hour=10)),
+        (MONDAY.replace(hour=11), MONDAY.replace(hour=12)),
+    ]
+
+
+def test_backend_selected_by_configuration(monkeypatch, tmp_path):
+    monkeypatch.setenv("CALENDAR_BACKEND", "sqlite")
+    monkeypatch.setenv("CALENDAR_DB", str(tmp_path / "calendar.db"))
+    backend = init_calendar()
+    assert isinstance(backend, SQLiteCalendarBackend)
+    assert backend.path == str(tmp_path / "calendar.db")
+    with pytest.raises(ValueError):
+        init_calendar("outlook")
@@ -0,0 +1,156 @@
+import asyncio
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+from fastapi.testclient import TestClient
+
+from cluster import NodeRegistry
+
+
+async def long_call(room_url, token, http_session, on_joined=None, **kwargs):
+    """Bot stand-in for the node servers: joins, talks for a while, hangs up."""
+    await on_joined()
+    await asyncio.sleep(3)
+
+
+def test_places_on_least_loaded_live_node():
+    registry = NodeRegistry(":memory:", node_ttl=10)
+    registry.register("a", "http://a", capacity=4)
+    registry.register("b", "http://b", capacity=2)
+    registry.heartbeat("a", live=1, capacity=4)
+
+    placed = [registry.place().node_id for _ in range(4)]
+    assert placed == ["b", "a", "b", "a"]
+    assert [node.live for node in registry.nodes()] == [3, 2]
+    assert registry.place(exclude=("a",)) is None
+
+
+def test_silent_nodes_are_skipped_and_their_sessions_lost():
+    registry = NodeRegistry(":memory:", node_ttl=10)
+    registry.register("a", "http://a", capacity=4)
+    registry.record_session("a-1", "a", "https://fake.daily.co/room")
+    assert registry.locate("a-1") == ("a", "running")
+
+    registry._db.execute("UPDATE nodes SET heartbeat = heartbeat - 60")
+    assert registry.place() is None
+    assert registry.locate("a-1") == ("a", "lost")
+
+
+def place_many(path, attempts, results):
+    registry = NodeRegistry(path)
+    results.put([getattr(registry.place(), "node_id", None) for _ in range(attempts)])
+
+
+def test_concurrent_dispatchers_never_overfill_a_node(tmp_path):
+    path = str(tmp_path / "cluster.db")
+    registry = NodeRegistry(path)
+    for node_id in "abc":
+        registry.register(node_id, f"http://{node_id}", capacity=5)
+
+    results = multiprocessing.Queue()
+    dispatchers = [
+        multiprocessing.Process(target=place_many, args=(path, 10, results))
+        for _ in range(4)
+    ]
+    for dispatcher in dispatchers:
+        dispatcher.start()
+    placed = [node for _ in dispatchers for node in results.get(timeout=30)]
+    for dispatcher in dispatchers:
+        dispatcher.join()
+
+    assert sorted(node for node in placed if node) == sorted("abc" * 5)
+    assert [node.live for node in registry.nodes()] == [5, 5, 5]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def wait_until(condition, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if condition():
+                return
+        except requests.ConnectionError:
+            pass
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.2)
+
+
+@pytest.fixture
+def nodes(tmp_path, monkeypatch):
+    db = str(tmp_path / "cluster.db")
+    procs, urls = [], []
+    for i in range(2):
+        port = free_port()
+        url = f"http://localhost:{port}"
+        env = dict(
+            os.environ,
+            SERVER_ROLE="node",
+            NODE_ID=f"node{i}",
+            NODE_URL=url,
+            FAST_API_PORT=str(port),
+            CLUSTER_DB=db,
+            DAILY_REST_FAKE="1",
+            MAX_SESSIONS="1",
+            MAX_LOAD_PER_CPU="1000",
+            MIN_FREE_MEMORY="0",
+            BOT_POOL_SIZE="1",
+            BOT_POOL_BOT="test_cluster:long_call",
+            BOT_POOL_WARMUP="",
+            NODE_HEARTBEAT="0.5",
+        )
+        procs.append(
+            subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port)],
+                env=env,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        )
+        urls.append(url)
+    try:
+        for url in urls:
+            wait_until(lambda: requests.get(f"{url}/pool").json()["bots"]["idle"] == 1)
+        monkeypatch.setenv("SERVER_ROLE", "dispatcher")
+        monkeypatch.setenv("CLUSTER_DB", db)
+        yield
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+
+def test_dispatcher_spreads_calls_and_resolves_status(nodes):
+    import server
+
+    with TestClient(server.app) as client:
+        assert client.get("/cluster").json()["capacity"] == 2
+
+        first = client.get("/", follow_redirects=False)
+        second = client.get("/", follow_redirects=False)
+        assert first.status_code == second.status_code == 307
+        bots = [first.headers["X-Bot-Id"], second.headers["X-Bot-Id"]]
+        placed = {client.get(f"/status/{bot}").json()["node"] for bot in bots}
+        assert placed == {"node0", "node1"}
+
+        full = client.get("/")
+        assert full.status_code == 503 and "Retry-After" in full.headers
+
+        wait_until(
+            lambda: all(
+                client.get(f"/status/{bot}").json()["status"] == "finished"
+                for bot in bots
+            )
+        )
+        assert client.get("/", follow_redirects=False).status_code == 307
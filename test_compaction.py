@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+import pytest
+
+from compaction import (
+    SUMMARY_PREFIX,
+    ContextCompactor,
+    TokenReport,
+    compact_messages,
+    count_tokens,
+)
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext
+
+ROLE = {"role": "system", "content": "Vous êtes Jérome."}
+ASK_DATES = {"role": "system", "content": "Obtenez les dates disponibles."}
+ASK_VISIT = {"role": "system", "content": "Collectez la date de visite."}
+
+
+def tool_exchange(call_id, name, result):
+    return [
+        {
+            "role": "assistant",
+            "content": "",
+            "tool_calls": [
+                {
+                    "id": call_id,
+                    "type": "function",
+                    "function": {"name": name, "arguments": "{}"},
+                }
+            ],
+        },
+        {"role": "tool", "tool_call_id": call_id, "content": json.dumps(result)},
+    ]
+
+
+def history():
+    dates = [f"2030-01-{day:02d}" for day in range(1, 29)]
+    return [
+        ROLE,
+        {"role": "system", "content": "Demandez le nom."},
+        {"role": "assistant", "content": "Bonjour, votre nom ?"},
+        {"role": "user", "content": "Léa Martin, née le 2 avril 1990"},
+        *tool_exchange("1", "record_personal_details", {"status": "success"}),
+        ASK_DATES,
+        *tool_exchange("2", "get_available_dates", {"dates": dates}),
+        ASK_VISIT,
+        {"role": "assistant", "content": "Quelle date ?"},
+    ]
+
+
+def test_completed_nodes_become_a_summary():
+    messages = history()
+    details = {"name": "Léa Martin", "date_of_birth": "1990-04-02"}
+
+    compacted = compact_messages(
+        messages, [ROLE["content"]], [ASK_VISIT["content"]], details
+    )
+
+    assert compacted[0] is ROLE
+    assert compacted[1]["content"].startswith(SUMMARY_PREFIX)
+    assert "Léa Martin" in compacted[1]["content"]
+    # The dates the node has to offer survive; the earlier turns don't.
+    assert compacted[2:4] == messages[-4:-2]
+    assert compacted[4:] == messages[-2:]
+    assert all(m["content"] != "Demandez le nom." for m in compacted)
+    assert count_tokens(compacted) < count_tokens(messages)
+
+    again = compact_messages(
+        compacted, [ROLE["content"]], [ASK_VISIT["content"]], details
+    )
+    assert again == compacted
+
+
+def test_context_is_left_alone_until_the_node_is_in_it():
+    messages = history()[:-2]
+    assert compact_messages(messages, [], [ASK_VISIT["content"]], {}) is messages
+
+
+@pytest.mark.asyncio
+async def test_compactor_reports_what_the_full_history_would_cost():
+    config = {
+        "initial_system_message": [ROLE],
+        "nodes": {
+            "get_available_dates": {"task_messages": [ASK_DATES], "functions": []},
+            "get_user_visit_date": {"task_messages": [ASK_VISIT], "functions": []},
+        },
+    }
+    report = TokenReport()
+    context = OpenAILLMContext(history())
+    full = count_tokens(context.messages)
+    compactor = ContextCompactor(
+        config, lambda: {}, lambda: "get_user_visit_date", report=report
+    )
+
+    compactor.compact(context)
+    compactor.compact(context)
+    for leftover in asyncio.all_tasks() - {asyncio.current_task()}:
+        leftover.cancel()
+
+    stats = report.summary()["get_user_visit_date"]
+    assert stats["calls"] == 2
+    assert stats["mean_prompt"] == count_tokens(context.messages) < full
+    assert stats["mean_uncompacted"] == full
+    assert stats["saved_pct"] > 0
@@ -0,0 +1,95 @@
+import multiprocessing
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+from cal import SQLiteCalendarBackend, availability_cache, book_visit, build_index
+from holds import SlotHolds
+
+SLOT = datetime(2030, 1, 7, 9)
+SLOT_END = SLOT + timedelta(minutes=30)
+
+
+@pytest.fixture(autouse=True)
+def reset_cache():
+    availability_cache.clear()
+    yield
+    availability_cache.clear()
+
+
+def test_overlapping_hold_is_refused():
+    holds = SlotHolds(":memory:")
+    assert holds.hold(SLOT, SLOT_END, "a")
+    assert not holds.hold(SLOT + timedelta(minutes=15), SLOT_END, "b")
+    assert holds.hold(SLOT_END, SLOT_END + timedelta(minutes=30), "b")
+    # Re-holding your own slot just refreshes it.
+    assert holds.hold(SLOT, SLOT_END, "a")
+
+
+def test_expired_hold_is_released_automatically():
+    holds = SlotHolds(":memory:")
+    assert holds.hold(SLOT, SLOT_END, "a", ttl=0)
+    assert holds.hold(SLOT, SLOT_END, "b")
+    assert not holds.confirm(SLOT, SLOT_END, "a")
+
+
+def test_confirmed_hold_outlives_its_ttl():
+    holds = SlotHolds(":memory:", ttl=0.01)
+    assert holds.hold(SLOT, SLOT_END, "a")
+    assert holds.confirm(SLOT, SLOT_END, "a")
+    holds.release("a")
+    assert not holds.hold(SLOT, SLOT_END, "b", ttl=0)
+    assert holds.held(SLOT, SLOT_END) == [(SLOT, SLOT_END)]
+
+
+def test_release_frees_unconfirmed_holds():
+    holds = SlotHolds(":memory:")
+    holds.hold(SLOT, SLOT_END, "a")
+    holds.release("a")
+    assert holds.hold(SLOT, SLOT_END, "b")
+
+
+def test_stale_availability_cannot_double_book(tmp_path):
+    calendar_path = str(tmp_path / "calendar.db")
+    holds = SlotHolds(str(tmp_path / "holds.db"))
+    day = date.today() + timedelta(days=7)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    # Two workers, each with its own backend connection and cached index.
+    first = SQLiteCalendarBackend(calendar_path)
+    second = SQLiteCalendarBackend(calendar_path)
+    availability_cache.get(second, lambda: build_index(second))
+
+    assert book_visit(first, day, "a", holds, "a") == datetime.combine(day, time(9))
+    assert book_visit(second, day, "b", holds, "b") == datetime.combine(
+        day, time(9, 30)
+    )
+
+
+def grab_slots(path, session, slots, results):
+    holds = SlotHolds(path)
+    won = [
+        start
+        for start in slots
+        if holds.hold(start, start + timedelta(minutes=30), session)
+    ]
+    results.put((session, won))
+
+
+def test_holds_are_exclusive_across_processes(tmp_path):
+    path = str(tmp_path / "holds.db")
+    SlotHolds(path).close()
+    slots = [SLOT + timedelta(minutes=30 * i) for i in range(20)]
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=grab_slots, args=(path, f"s{i}", slots, results))
+        for i in range(6)
+    ]
+    for worker in workers:
+        worker.start()
+    won = [results.get(timeout=30) for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    taken = [start for _, starts in won for start in starts]
+    assert sorted(taken) == slots
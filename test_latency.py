@@ -0,0 +1,133 @@
+import asyncio
+import inspect
+
+import pytest
+
+from pipecat.frames.frames import (
+    EndFrame,
+    FunctionCallInProgressFrame,
+    TextFrame,
+    TranscriptionFrame,
+    TTSAudioRawFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.pipeline.pipeline import Pipeline
+from pipecat.pipeline.runner import PipelineRunner
+from pipecat.pipeline.task import PipelineTask
+
+from latency import LatencyRecorder, TurnTracker
+from metrics import Histogram
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_histogram_quantiles_land_in_the_right_bucket():
+    histogram = Histogram(buckets=(0.1, 0.2, 0.5, 1.0))
+    for value in [0.05] * 50 + [0.4] * 45 + [2.0] * 5:
+        histogram.observe(value)
+
+    assert 0 < histogram.quantile(0.5) <= 0.1
+    assert 0.2 < histogram.quantile(0.9) <= 0.5
+    assert histogram.quantile(0.99) > 1.0
+    assert histogram.cumulative()[-1] == (float("inf"), 100)
+    assert histogram.summary()["count"] == 100
+
+
+def test_turn_stages_are_timed_from_end_of_speech():
+    recorder, clock = LatencyRecorder(capacity=2), Clock()
+    tracker = TurnTracker("s", recorder, node=lambda: "collect_dates", clock=clock)
+
+    for t, stage in [
+        (1.0, "vad_end"),
+        (1.2, "transcript"),
+        (1.6, "llm_first_token"),
+        (1.7, "llm_first_token"),  # only the first token counts
+        (1.9, "tts_first_audio"),
+        (2.1, "audio_out"),
+    ]:
+        clock.now = t
+        tracker.mark(stage)
+
+    turn = recorder.turns[-1]
+    assert turn.node == "collect_dates"
+    assert {k: round(v, 3) for k, v in turn.marks.items()} == {
+        "transcript": 0.2,
+        "llm_first_token": 0.6,
+        "tts_first_audio": 0.9,
+        "audio_out": 1.1,
+    }
+    assert recorder.histogram("audio_out", "collect_dates").count == 1
+    assert tracker.turn is None
+
+
+def test_ring_buffer_keeps_only_recent_turns():
+    recorder = LatencyRecorder(capacity=3)
+    tracker = TurnTracker("s", recorder)
+    for _ in range(10):
+        tracker.mark("vad_end")
+        tracker.mark("audio_out")
+    assert len(recorder.turns) == 3
+    assert recorder.histogram("audio_out", None).count == 10
+
+
+@pytest.mark.asyncio
+async def test_timed_handler_keeps_its_signature_and_reports_duration():
+    recorder = LatencyRecorder()
+    tracker = TurnTracker("s", recorder, node=lambda: "collect_dates")
+
+    async def get_available_dates(args):
+        await asyncio.sleep(0.01)
+        return {"dates": []}
+
+    timed = tracker.timed("get_available_dates", get_available_dates)
+    assert "args" in inspect.signature(timed).parameters
+    assert await timed({}) == {"dates": []}
+
+    histogram = recorder.histogram("handler:get_available_dates", "collect_dates")
+    assert histogram.count == 1 and histogram.sum >= 0.01
+    assert recorder.slowest("handler:get_available_dates")[0][0] == "collect_dates"
+
+
+@pytest.mark.asyncio
+async def test_taps_pass_frames_through_and_mark_their_stages():
+    recorder = LatencyRecorder()
+    tracker = TurnTracker("s", recorder)
+    pipeline = Pipeline(
+        [
+            tracker.tap("vad_start", "vad_end"),
+            tracker.tap("transcript"),
+            tracker.tap("llm_first_token", "function_call"),
+            tracker.tap("tts_first_audio"),
+            tracker.tap("audio_out"),
+        ]
+    )
+    task = PipelineTask(pipeline)
+    await task.queue_frames(
+        [
+            UserStoppedSpeakingFrame(),
+            TranscriptionFrame("bonjour", "user", "now"),
+            FunctionCallInProgressFrame("get_departments", "call-1", {}),
+            TextFrame("Très bien"),
+            TTSAudioRawFrame(b"\0\0" * 160, 16000, 1),
+            EndFrame(),
+        ]
+    )
+    await asyncio.wait_for(PipelineRunner(handle_sigint=False).run(task), 10)
+    tracker.finish()
+    # Upstream push tasks outlive the EndFrame; asyncio.run() would cancel
+    # them, pytest-asyncio doesn't, and they spin when the loop closes.
+    for leftover in asyncio.all_tasks() - {asyncio.current_task()}:
+        leftover.cancel()
+
+    assert set(recorder.turns[-1].marks) == {
+        "transcript",
+        "function_call",
+        "llm_first_token",
+        "tts_first_audio",
+    }
@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+import patient_flow
+from loadsim import Timings, make_personas, simulate
+
+
+def test_personas_are_reproducible():
+    assert make_personas(5, seed=1) == make_personas(5, seed=1)
+    assert make_personas(5, seed=1) != make_personas(5, seed=2)
+
+
+@pytest.mark.asyncio
+async def test_scripted_sessions_walk_the_whole_flow(monkeypatch):
+    monkeypatch.setattr(patient_flow, "_calendar", None)
+
+    report = await simulate(6, concurrency=3, timings=Timings().scaled(0.02))
+    for leftover in asyncio.all_tasks() - {asyncio.current_task()}:
+        leftover.cancel()
+
+    assert report.completed == 6 and report.booked == 6
+    assert report.peak_live == 3
+    assert report.sessions_per_second > 0
+    summary = report.recorder.summary()
+    assert set(summary["audio_out"]) >= {
+        "start",
+        "get_allergies",
+        "get_user_visit_date",
+    }
+    assert (
+        summary["handler:record_user_visit_date"]["get_user_visit_date"]["count"] == 6
+    )
+    assert report.tokens.summary()["confirm"]["saved_pct"] > 50
+    assert report.loop.lag.count > 0
+    assert "sessions/s" in report.format()
@@ -0,0 +1,76 @@
+import os
+import subprocess
+from collections import Counter
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from metrics import Histogram, ProcessSampler, render_histogram, render_metric
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value)
+
+    lines = render_histogram("join_seconds", "Join.", {(("node", "a"),): histogram})
+    assert lines[1] == "# TYPE join_seconds histogram"
+    assert 'join_seconds_bucket{node="a",le="0.1"} 1' in lines
+    assert 'join_seconds_bucket{node="a",le="1.0"} 2' in lines
+    assert 'join_seconds_bucket{node="a",le="+Inf"} 3' in lines
+    assert 'join_seconds_count{node="a"} 3' in lines
+
+
+def test_label_values_are_escaped():
+    [_, _, line] = render_metric("x", "gauge", "X.", [({"room": 'a"b\\c'}, 1)])
+    assert line == 'x{room="a\\"b\\\\c"} 1'
+
+
+def test_process_usage_is_sampled_and_cached():
+    sampler = ProcessSampler(interval=60)
+    rss, cpu = sampler.sample([os.getpid()])[os.getpid()]
+    assert rss > 0 and cpu >= 0
+    assert sampler.sample([os.getpid()])[os.getpid()] == (rss, cpu)
+    assert sampler.sample([2**22 + 1]) == {}
+
+
+class SleepingBot(subprocess.Popen):
+    """Runs a stand-in bot so there is a real process to sample."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(["sleep", "30"])
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("DAILY_REST_FAKE", "1")
+    monkeypatch.setenv("MAX_LOAD_PER_CPU", "1000")
+    monkeypatch.setenv("MIN_FREE_MEMORY", "0")
+    monkeypatch.setattr(subprocess, "Popen", SleepingBot)
+    for name in ("room_create_seconds", "token_fetch_seconds", "session_seconds"):
+        monkeypatch.setattr(server, name, Histogram())
+    monkeypatch.setattr(server, "bot_exits", Counter())
+    with TestClient(server.app) as client:
+        yield client
+    server.bot_procs.clear()
+    server.finished_bots.clear()
+
+
+def test_metrics_cover_sessions_rest_calls_and_processes(client):
+    assert client.get("/", follow_redirects=False).status_code == 307
+    [(pid, (proc, _))] = server.bot_procs.items()
+
+    body = client.get("/metrics").text
+    assert 'bot_sessions{state="active"} 1' in body
+    assert "daily_room_create_seconds_count 1" in body
+    assert "daily_token_fetch_seconds_count 1" in body
+    assert f'bot_process_resident_bytes{{bot_id="{pid}",pid="{pid}"}}' in body
+
+    proc.kill()
+    proc.wait()
+    server.reap_bots()
+    body = client.get("/metrics").text
+    assert 'bot_sessions{state="active"} 0' in body
+    assert 'bot_sessions_finished_total{code="-9"} 1' in body
+    assert "bot_session_seconds_count 1" in body
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from async_cal import AsyncCalendar
+from cal import SQLiteCalendarBackend, availability_cache, create_event
+from outbox import BookingOutbox, OutboxBackend, OutboxFlusher
+
+START = datetime(2024, 12, 16, 9)
+END = START + timedelta(minutes=30)
+
+
+class FlakyBackend(SQLiteCalendarBackend):
+    """Writes the batch, then fails as if the response had been lost."""
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+        self.calls = 0
+
+    def add_events(self, events):
+        self.calls += 1
+        super().add_events(events)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("response lost")
+
+
+def event_count(backend):
+    return backend._db.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+
+@pytest.fixture(autouse=True)
+def reset_cache():
+    availability_cache.clear()
+    yield
+    availability_cache.clear()
+
+
+def test_enqueue_is_idempotent():
+    outbox = BookingOutbox(":memory:")
+    assert outbox.enqueue(START, END, "visit") == outbox.enqueue(START, END, "visit")
+    assert outbox.counts() == {"pending": 1}
+
+
+def test_pending_bookings_count_as_busy():
+    backend = OutboxBackend(SQLiteCalendarBackend(), BookingOutbox(":memory:"))
+    create_event(backend, START, "visit")
+    assert backend.get_busy(START - timedelta(hours=1), END) == [(START, END)]
+    assert event_count(backend.backend) == 0
+
+
+@pytest.mark.asyncio
+async def test_flusher_batches_pending_bookings():
+    backend = SQLiteCalendarBackend()
+    outbox = BookingOutbox(":memory:")
+    for i in range(45):
+        outbox.enqueue(START + timedelta(minutes=30 * i), END, f"visit {i}")
+
+    flusher = OutboxFlusher(outbox, AsyncCalendar(backend), batch_size=20)
+    assert await flusher.flush() == 45
+    assert event_count(backend) == 45
+    assert outbox.counts() == {"done": 45}
+
+
+@pytest.mark.asyncio
+async def test_retry_after_lost_response_does_not_duplicate():
+    backend = FlakyBackend(failures=1)
+    outbox = BookingOutbox(":memory:")
+    outbox.enqueue(START, END, "visit")
+    flusher = OutboxFlusher(outbox, AsyncCalendar(backend), backoff=0)
+
+    assert await flusher.flush() == 0
+    assert outbox.counts() == {"pending": 1}
+    assert await flusher.flush() == 1
+    assert backend.calls == 2
+    assert event_count(backend) == 1
+
+
+@pytest.mark.asyncio
+async def test_booking_gives_up_after_max_attempts():
+    backend = FlakyBackend(failures=10)
+    outbox = BookingOutbox(":memory:")
+    outbox.enqueue(START, END, "visit")
+    flusher = OutboxFlusher(outbox, AsyncCalendar(backend), backoff=0, max_attempts=3)
+
+    for _ in range(5):
+        await flusher.flush()
+    assert backend.calls == 3
+    assert outbox.counts() == {"failed": 1}
+
+
+def test_claims_are_leased_across_processes(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    first, second = BookingOutbox(path), BookingOutbox(path)
+    first.enqueue(START, END, "visit")
+
+    assert len(first.claim(10)) == 1
+    assert second.claim(10) == []
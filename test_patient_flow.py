@@ -0,0 +1,42 @@
+import pytest
+
+from patient_flow import IntakeSession, create_flow_config
+
+
+def handler(config, node, name):
+    for function in config["nodes"][node]["functions"]:
+        if function["function"]["name"] == name:
+            return function["function"]["handler"]
+    raise KeyError(name)
+
+
+@pytest.mark.asyncio
+async def test_sessions_do_not_share_patient_details():
+    alice, bob = IntakeSession(), IntakeSession()
+    alice_flow, bob_flow = create_flow_config(alice), create_flow_config(bob)
+
+    await handler(alice_flow, "start", "record_personal_details")(
+        args={"name": "Alice Martin", "date_of_birth": "1990-04-02"}
+    )
+    await handler(bob_flow, "start", "record_personal_details")(
+        args={"name": "Bob Durand", "date_of_birth": "1985-11-20"}
+    )
+    await handler(bob_flow, "get_allergies", "record_allergies")(
+        args={"allergies": [{"name": "pollen"}]}
+    )
+
+    assert alice.patient_details == {
+        "name": "Alice Martin",
+        "date_of_birth": "1990-04-02",
+    }
+    assert bob.patient_details["name"] == "Bob Durand"
+    assert bob.patient_details["allergies"] == [{"name": "pollen"}]
+    assert alice.session_id != bob.session_id
+
+
+def test_flow_config_template_stays_unbound():
+    from patient_flow import flow_config, record_personal_details
+
+    create_flow_config(IntakeSession())
+    start = flow_config["nodes"]["start"]["functions"][0]["function"]
+    assert start["handler"] is record_personal_details
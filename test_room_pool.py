@@ -0,0 +1,73 @@
+import asyncio
+import sys
+
+import aiohttp
+import pytest
+
+from room_pool import FakeDailyRESTHelper, RoomPool
+from runner import configure
+
+
+async def wait_for(condition, timeout=5.0):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+@pytest.mark.asyncio
+async def test_acquire_skips_rest_round_trips():
+    helper = FakeDailyRESTHelper(latency=0.05)
+    pool = RoomPool(helper, size=3)
+    await pool.start()
+    try:
+        await wait_for(lambda: pool.stats()["ready"] == 3)
+        calls = dict(helper.calls)
+
+        room = await asyncio.wait_for(pool.acquire(), 0.01)
+        assert helper.calls == calls
+        assert helper.tokens[room.token] == room.url
+
+        await wait_for(lambda: pool.stats()["ready"] == 3)
+        assert pool.stats() == {"ready": 3, "hits": 1, "misses": 0, "failures": 0}
+    finally:
+        await pool.stop()
+    assert helper.rooms.keys() == {helper.get_name_from_url(room.url)}
+
+
+@pytest.mark.asyncio
+async def test_empty_pool_provisions_on_demand():
+    helper = FakeDailyRESTHelper()
+    pool = RoomPool(helper, size=1)
+    room = await pool.acquire()
+    assert room.token in helper.tokens
+    assert pool.misses == 1
+
+
+@pytest.mark.asyncio
+async def test_expiring_rooms_are_replaced():
+    helper = FakeDailyRESTHelper()
+    pool = RoomPool(helper, size=2, ttl=60, min_remaining=30)
+    await pool.start()
+    try:
+        await wait_for(lambda: pool.stats()["ready"] == 2)
+        stale = [room.url for room in pool._ready]
+        for room in pool._ready:
+            room.expires -= 40
+
+        room = await pool.acquire()
+        assert room.url not in stale
+        await wait_for(lambda: helper.calls["delete"] == 2)
+    finally:
+        await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_configure_uses_the_given_token(monkeypatch):
+    monkeypatch.delenv("DAILY_API_KEY", raising=False)
+    monkeypatch.setattr(
+        sys, "argv", ["bot", "-u", "https://fake.daily.co/room", "-t", "secret"]
+    )
+    async with aiohttp.ClientSession() as session:
+        assert await configure(session) == ("https://fake.daily.co/room", "secret")